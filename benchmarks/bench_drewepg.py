@@ -0,0 +1,112 @@
+"""Benchmark drewepg.merge_and_filter_epg against a local source server.
+
+Synthetic feeds of each size are served from 127.0.0.1, and the merge runs in
+a child process. That keeps its peak RSS separate from the generator's.
+Run from the repository root:
+
+    python benchmarks/bench_drewepg.py --sizes 100,400,1600 --parse-workers 2
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from source_server import SourceServer  # noqa: E402
+from xmltv_gen import make_source_set  # noqa: E402
+
+
+def run_child(config):
+    """Run one merge as configured and print its measurements as JSON"""
+    import drewepg
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(config["runs"]):
+            drewepg.merge_and_filter_epg(
+                config["sources"], config["playlist"], config["output"],
+                cache_dir=config["cache_dir"], parse_workers=config["parse_workers"],
+                fetch_budget=config["fetch_budget"])
+    seconds = (time.perf_counter() - start) / config["runs"]
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({"seconds": seconds, "peak_kb": peak_kb, "output_bytes": os.path.getsize(config["output"])}))
+
+
+def measure(config):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)],
+                          capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def bench_size(args, channels, workdir):
+    files, playlist = make_source_set(args.sources, channels, args.programmes,
+                                      malformed_rate=args.malformed, seed=channels)
+    raw_bytes = sum(len(gzip.decompress(b) if p.endswith(".gz") else b) for p, b in files.items())
+    items = args.sources * channels * (args.programmes + 1)
+    files["/playlist.m3u8"] = playlist
+
+    fail_paths = [f"/down{i}.xml.gz" for i in range(args.fail)]
+    with SourceServer(files) as server, SourceServer({}, fail_paths=fail_paths) as down:
+        sources = [server.url(p) for p in files if p != "/playlist.m3u8"] + [down.url(p) for p in fail_paths]
+        config = {
+            "sources": sources,
+            "playlist": server.url("/playlist.m3u8"),
+            "output": os.path.join(workdir, f"bench-{channels}.xml.gz"),
+            "cache_dir": os.path.join(workdir, f"cache-{channels}") if args.cache else None,
+            "parse_workers": args.parse_workers,
+            "fetch_budget": args.fetch_budget,
+            "runs": 1,
+        }
+        results = [("cold", measure(config))]
+        if args.cache:
+            results.append(("warm", measure(config)))
+
+    for label, r in results:
+        print(f"  {channels:>6} ch/feed {label:<4} {r['seconds']:7.2f} s  "
+              f"{raw_bytes / r['seconds'] / 1e6:8.1f} MB/s  {items / r['seconds']:10.0f} items/s  "
+              f"peak {r['peak_kb'] / 1024:7.1f} MB  in {raw_bytes / 1e6:7.1f} MB  out {r['output_bytes'] / 1e6:6.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,400,1600",
+                        help="comma-separated channels per feed, one benchmark each")
+    parser.add_argument("--sources", type=int, default=8, help="feeds per benchmark")
+    parser.add_argument("--programmes", type=int, default=96, help="programmes per channel")
+    parser.add_argument("--malformed", type=float, default=0.01,
+                        help="fraction of titles carrying control or invalid UTF-8 bytes")
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--cache", action="store_true",
+                        help="enable the shard cache and also time a warm second run")
+    parser.add_argument("--fail", type=int, default=0,
+                        help="add this many sources on a host that always answers 503")
+    parser.add_argument("--fetch-budget", type=int, default=600)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    print(f"📊 drewepg benchmark: {args.sources} feeds x {args.programmes} programmes/channel, "
+          f"parse workers {args.parse_workers}, cache {'on' if args.cache else 'off'}, failing sources {args.fail}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes.split(","):
+            bench_size(args, int(size), workdir)
+
+
+if __name__ == "__main__":
+    main()
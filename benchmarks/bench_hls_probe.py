@@ -0,0 +1,120 @@
+"""Exercise the HLS probe stage against a local stand-in for stream servers.
+
+One event is served as several candidate streams that differ in latency,
+throughput and health. The script probes them all the way scrape_common
+does for both scrapers and checks which one pick_stream publishes. Run from
+the repository root:
+
+    python benchmarks/bench_hls_probe.py --events 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scrape_common import describe_probe, pick_stream, probe_candidates  # noqa: E402
+from source_server import SourceServer  # noqa: E402
+
+SEGMENT = bytes(range(256)) * 1024 * 2  # 512 KB of "video"
+TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+
+def master(variants):
+    lines = ["#EXTM3U"]
+    for bandwidth, uri in variants:
+        lines += [f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}", uri]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def media(segments):
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:6", "#EXT-X-MEDIA-SEQUENCE:100"]
+    for uri in segments:
+        lines += ["#EXTINF:6.0,", uri]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def stand_in_event(n):
+    """Return files, path delays, rates and {candidate path: expected verdict} for event n"""
+    p = f"/event{n}"
+    files = {
+        # Healthy but slow to start: the master answers late and segments crawl
+        f"{p}/slow/master.m3u8": master([(800000, "low/index.m3u8")]),
+        f"{p}/slow/low/index.m3u8": media(["seg100.ts", "seg101.ts"]),
+        f"{p}/slow/low/seg100.ts": SEGMENT,
+        # Healthy and fast: the one that should be published
+        f"{p}/fast/master.m3u8": master([(800000, "low/index.m3u8"), (3000000, "high/index.m3u8")]),
+        f"{p}/fast/low/index.m3u8": media(["seg100.ts", "seg101.ts"]),
+        f"{p}/fast/low/seg100.ts": SEGMENT,
+        # Playlists load but the segment is gone
+        f"{p}/dead/index.m3u8": media(["seg100.ts"]),
+        # An error page served with 200
+        f"{p}/html/index.m3u8": b"<html><body>403 Forbidden</body></html>",
+    }
+    delays = {f"{p}/slow/master.m3u8": 0.3}
+    rates = {f"{p}/slow/low/seg100.ts": 4 * 1024 * 1024}
+    expected = {
+        f"{p}/slow/master.m3u8": "healthy",
+        f"{p}/fast/master.m3u8": "picked",
+        # A variant of the fast master, also seen by the scraper: the master wins
+        f"{p}/fast/low/index.m3u8": "healthy",
+        f"{p}/dead/index.m3u8": "playlist only",
+        f"{p}/html/index.m3u8": "failed",
+    }
+    return files, delays, rates, expected
+
+
+def verdict(probe, picked):
+    if probe is picked:
+        return "picked"
+    if probe.healthy:
+        return "healthy"
+    return "playlist only" if probe.playlist_ok else "failed"
+
+
+async def run(server, events, expected):
+    ok = True
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            probe_candidates(session, [server.url(path) for path in expected[n]], {}, TIMEOUT)
+            for n in range(events)
+        ))
+        elapsed = time.perf_counter() - start
+        for n, probes in enumerate(results):
+            picked = pick_stream(probes)
+            for probe, (path, want) in zip(probes, expected[n].items()):
+                got = verdict(probe, picked)
+                ok &= got == want
+                if n == 0 or got != want:
+                    mark = "✅" if got == want else "❌"
+                    print(f"{mark} {path:<28} {got:<13} {describe_probe(probe)}")
+    candidates = sum(len(e) for e in expected)
+    print(f"⏱️ Probed {candidates} candidates for {events} events in {elapsed:.2f} s")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=10, help="stand-in events probed concurrently")
+    args = parser.parse_args()
+
+    files, delays, rates, expected = {}, {}, {}, []
+    for n in range(args.events):
+        f, d, r, e = stand_in_event(n)
+        files.update(f)
+        delays.update(d)
+        rates.update(r)
+        expected.append(e)
+    with SourceServer(files, path_delays=delays, rates=rates) as server:
+        ok = asyncio.run(run(server, args.events, expected))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
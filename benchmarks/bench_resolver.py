@@ -0,0 +1,75 @@
+"""Exercise streamedsu's HTTP-only resolver tiers against local stand-in embeds.
+
+Each stand-in page models one way an embed exposes (or hides) its stream.
+The script checks which tier resolves it and times the lookups. Run from the
+repository root:
+
+    python benchmarks/bench_resolver.py --repeat 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import streamedsu  # noqa: E402
+from scrape_common import make_http_session  # noqa: E402
+from source_server import SourceServer  # noqa: E402
+
+PLAYLIST = b"#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\nlow/index.m3u8\n"
+
+
+def stand_in_pages(base):
+    """Return {path: body} and {embed path: tier expected to resolve it}"""
+    stream = f"{base}/live/index.m3u8"
+    files = {
+        "/live/index.m3u8": PLAYLIST,
+        "/embed/static.html": f'<html><video src="{stream}"></video></html>',
+        "/embed/config.html": '<script>jwplayer("p").setup({"file":"%s"});</script>'
+                              % stream.replace("/", "\\/"),
+        "/embed/nested.html": '<html><iframe src="/player/inner.html?id=1&amp;x=2"></iframe></html>',
+        "/player/inner.html": f"<script>var src = '{stream}';</script>",
+        "/embed/decoy.html": f'<a href="{base}/expired/index.m3u8">old</a>',
+        "/embed/dynamic.html": '<script src="/player.js"></script><div id="player"></div>',
+    }
+    expected = {
+        "/embed/static.html": "html",
+        "/embed/config.html": "html",
+        "/embed/nested.html": "iframe",
+        "/embed/decoy.html": None,
+        "/embed/dynamic.html": None,
+    }
+    return {path: body if isinstance(body, bytes) else body.encode() for path, body in files.items()}, expected
+
+
+async def run(server, expected, repeat):
+    ok = True
+    async with make_http_session(streamedsu.HTTP_CONNECTIONS, streamedsu.HTTP_PER_HOST) as session:
+        for path, want in expected.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                url, tier = await streamedsu.resolve_http(session, server.url(path))
+            ms = (time.perf_counter() - start) / repeat * 1000
+            mark = "✅" if tier == want else "❌"
+            ok &= tier == want
+            print(f"{mark} {path:<22} tier {tier or 'browser':<8} expected {want or 'browser':<8} {ms:6.2f} ms")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="lookups per stand-in page")
+    args = parser.parse_args()
+
+    with SourceServer({}) as server:
+        files, expected = stand_in_pages(server.url("").rstrip("/"))
+        server.files.update(files)
+        ok = asyncio.run(run(server, expected, args.repeat))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
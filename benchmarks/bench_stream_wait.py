@@ -0,0 +1,182 @@
+"""Time streamedsu's event-driven extract_m3u8 against the old fixed sleeps.
+
+Playwright is not needed: a fake page fires request and popup events on a
+schedule that models how real embeds behave (stream on the first click, ad
+tab then stream on the second click, stream only in the page source). Both
+versions must find the same URL; the script prints the per-embed latency.
+Run from the repository root:
+
+    python benchmarks/bench_stream_wait.py --repeat 3
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamedsu  # noqa: E402
+
+STREAM = "https://cdn.example/live/index.m3u8"
+ANALYTICS = "https://prd.jwpltx.com/v1/jwplayer6/ping.gif?u=a.m3u8"
+
+
+class Event:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakeTab:
+    url = "https://ads.example/landing"
+
+    def __init__(self, context):
+        self.context = context
+
+    async def close(self):
+        self.context.pages.remove(self)
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+
+
+class FakeMouse:
+    def __init__(self, page):
+        self.page = page
+
+    async def click(self, x, y):
+        self.page.clicks += 1
+        self.page.on_click(self.page.clicks)
+
+
+class FakePage:
+    """Page stand-in; scenario decides what each mouse click sets off"""
+
+    def __init__(self, scenario):
+        self.handlers = {}
+        self.clicks = 0
+        self.scenario = scenario
+        self.context = FakeContext()
+        self.context.pages.append(self)
+        self.mouse = FakeMouse(self)
+        self.loop = asyncio.get_running_loop()
+
+    def on(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def remove_listener(self, event, handler):
+        self.handlers[event].remove(handler)
+
+    def emit(self, event, payload):
+        for handler in list(self.handlers.get(event, [])):
+            result = handler(payload)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+
+    def later(self, delay, event, payload):
+        self.loop.call_later(delay, self.emit, event, payload)
+
+    def on_click(self, n):
+        kind = self.scenario
+        if kind == "first-click" and n == 1:
+            self.later(0.15, "request", Event(STREAM))
+        elif kind == "ad-then-second-click":
+            if n == 1:
+                tab = FakeTab(self.context)
+                self.context.pages.append(tab)
+                self.later(0.1, "popup", tab)
+            elif n == 2:
+                self.later(0.2, "request", Event(STREAM))
+
+    async def goto(self, url, **kwargs):
+        self.emit("request", Event(ANALYTICS))
+        if self.scenario == "on-load":
+            self.later(0.05, "request", Event(STREAM))
+
+    async def bring_to_front(self):
+        pass
+
+    async def query_selector(self, selector):
+        return None
+
+    async def content(self):
+        if self.scenario == "page-source":
+            return f'<script>var src = "{STREAM}";</script>'
+        return "<html></html>"
+
+
+async def legacy_extract_m3u8(page, embed_url):
+    """The fixed-sleep sequence extract_m3u8 used before, kept as the baseline"""
+    found = None
+
+    def on_request(request):
+        nonlocal found
+        if ".m3u8" in request.url and not found and "prd.jwpltx.com" not in request.url:
+            found = request.url
+
+    page.on("request", on_request)
+    await page.goto(embed_url, wait_until="domcontentloaded", timeout=5000)
+    await page.bring_to_front()
+    await page.mouse.click(200, 200)
+    pages_before = list(page.context.pages)
+    new_tab = None
+    for _ in range(12):
+        pages_now = page.context.pages
+        if len(pages_now) > len(pages_before):
+            new_tab = [p for p in pages_now if p not in pages_before][0]
+            break
+        await asyncio.sleep(0.25)
+    if new_tab:
+        await asyncio.sleep(0.5)
+        await new_tab.close()
+    await asyncio.sleep(1)
+    await page.mouse.click(200, 200)
+    for _ in range(4):
+        if found:
+            break
+        await asyncio.sleep(0.25)
+    if not found:
+        matches = streamedsu.M3U8_RE.findall(await page.content())
+        if matches:
+            found = matches[0]
+    page.remove_listener("request", on_request)
+    return found
+
+
+async def timed(extract, scenario, repeat):
+    total = 0.0
+    for _ in range(repeat):
+        page = FakePage(scenario)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            url = await extract(page, "https://embed.example/e/1")
+        total += time.perf_counter() - start
+    return url, total / repeat
+
+
+async def run(repeat):
+    ok = True
+    for scenario in ("on-load", "first-click", "ad-then-second-click", "page-source"):
+        old_url, old_s = await timed(legacy_extract_m3u8, scenario, repeat)
+        new_url, new_s = await timed(streamedsu.extract_m3u8, scenario, repeat)
+        same = old_url == new_url == STREAM
+        ok &= same
+        mark = "✅" if same else "❌"
+        print(f"{mark} {scenario:<22} fixed sleeps {old_s:5.2f} s  events {new_s:5.2f} s  "
+              f"({old_s / max(new_s, 1e-3):5.1f}x)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario and version")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.repeat)) else 1)
+
+
+if __name__ == "__main__":
+    main()
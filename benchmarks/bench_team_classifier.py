@@ -0,0 +1,76 @@
+"""Micro-benchmark: ppv's TeamClassifier against the old per-team substring scan.
+
+Also grows the team tables with synthetic teams to show that the cost per
+name stays flat as leagues are added. Run from the repository root:
+
+    python benchmarks/bench_team_classifier.py --names 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ppv import COLLEGE_TEAMS, NFL_TEAMS, build_team_classifier  # noqa: E402
+
+FILLER = ["live", "week 7", "preseason", "hd", "replay", "@", "vs", "at", "(alt feed)", "2nd half"]
+
+
+def legacy_classify(name, nfl_teams, college_teams):
+    """The substring scan build_m3u used before TeamClassifier, kept as the baseline"""
+    result = None
+    for t in nfl_teams:
+        if t in name:
+            result = ("PPVLand - NFL Action", "NFL.Dummy.us")
+    for t in college_teams:
+        if t in name:
+            result = ("PPVLand - College Football", "NCAA.Football.Dummy.us")
+    return result
+
+
+def make_names(count, teams, seed=0):
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        parts = [rng.choice(teams), rng.choice(FILLER), rng.choice(teams)] if rng.random() < 0.7 else \
+            [rng.choice(FILLER), "special event", rng.choice(FILLER)]
+        names.append(" ".join(parts))
+    return names
+
+
+def timed(fn, names):
+    start = time.perf_counter()
+    for name in names:
+        fn(name)
+    return (time.perf_counter() - start) / len(names) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=20000, help="event names per measurement")
+    parser.add_argument("--scale", default="1,4,16", help="comma-separated team table multipliers")
+    args = parser.parse_args()
+
+    nfl, college = sorted(NFL_TEAMS), sorted(COLLEGE_TEAMS)
+    names = make_names(args.names, nfl + college)
+    classifier = build_team_classifier()
+    mismatches = sum(legacy_classify(n, nfl, college) != classifier.classify(n, "American Football")
+                     for n in names)
+    print(f"🏈 {args.names} names, {len(nfl) + len(college)} teams, {mismatches} disagreements with the old scan")
+
+    for scale in (int(s) for s in args.scale.split(",")):
+        # Synthetic extra teams, so the tables grow while the names stay the same
+        extra = [f"{team} {k}" for k in range(1, scale) for team in nfl + college]
+        more_nfl, more_college = nfl + extra[:len(extra) // 2], college + extra[len(extra) // 2:]
+        grown = build_team_classifier()
+        grown.add_league("American Football", "PPVLand - NFL Action", "NFL.Dummy.us", more_nfl)
+        legacy_us = timed(lambda n: legacy_classify(n, more_nfl, more_college), names)
+        new_us = timed(lambda n: grown.classify(n, "American Football"), names)
+        print(f"⏱️ {len(more_nfl) + len(more_college):>5} teams  substring scan {legacy_us:7.2f} µs/name  "
+              f"TeamClassifier {new_us:6.2f} µs/name  ({legacy_us / new_us:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
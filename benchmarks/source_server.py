@@ -0,0 +1,90 @@
+"""Local HTTP stand-in for the EPG sources and playlist drewepg downloads."""
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    # socketserver's default backlog of 5 stalls concurrent clients on SYN retries
+    request_queue_size = 128
+
+
+class SourceServer:
+    """Serve in-memory files on 127.0.0.1 from a background thread.
+
+    Responses carry a strong ETag and honour If-None-Match with a 304, like
+    raw.githubusercontent.com. Paths in fail_paths answer 503 and every
+    response can be slowed by delay seconds, to exercise retries and the
+    circuit breaker. Per path, path_delays adds a delay before the response
+    and rates caps the body to that many bytes per second, so streams can
+    differ in latency and throughput. Use as a context manager; url(path)
+    gives the full URL.
+    """
+
+    def __init__(self, files, fail_paths=(), delay=0.0, path_delays=None, rates=None):
+        self.files = dict(files)
+        self.fail_paths = set(fail_paths)
+        self.delay = delay
+        self.path_delays = dict(path_delays or {})
+        self.rates = dict(rates or {})
+        self.requests = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        self.httpd = _Server(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                path = self.path.split("?", 1)[0]
+                delay = server.delay + server.path_delays.get(path, 0.0)
+                if delay:
+                    time.sleep(delay)
+                if path in server.fail_paths:
+                    return self._reply(503)
+                body = server.files.get(path)
+                if body is None:
+                    return self._reply(404)
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    with server.lock:
+                        server.not_modified += 1
+                    return self._reply(304, etag=etag)
+                self._reply(200, body, etag, server.rates.get(path))
+
+            def _reply(self, status, body=b"", etag=None, rate=None):
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body and rate:
+                    step = 16 * 1024
+                    for pos in range(0, len(body), step):
+                        self.wfile.write(body[pos:pos + step])
+                        self.wfile.flush()
+                        time.sleep(len(body[pos:pos + step]) / rate)
+                elif body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,77 @@
+"""Synthetic XMLTV feeds and playlists for exercising drewepg offline."""
+import gzip
+import random
+import time
+
+TITLES = ["Evening News", "Café Crème", "Fútbol en Vivo", "Téléjournal", "Tom &amp; Jerry",
+          "Ça commence aujourd'hui", "ニュース", "Late Movie", "Morning Show", "Documentary"]
+
+# Byte sequences the sanitizer has to cope with, injected at malformed_rate
+MALFORMED = [b"\x01", b"\x0b", b"\xff\xfe", b"\xc3", b"&amp;amp;", b"\xef\xbf\xbf"]
+
+
+def channel_id(n):
+    return f"bench{n}.us"
+
+
+def make_feed(channels, programmes, first_channel=0, malformed_rate=0.0, compress=False,
+              start=None, duration=1800, seed=0):
+    """Return one XMLTV document as bytes.
+
+    Covers channels channel_id(first_channel) onwards, each with programmes
+    back-to-back slots of duration seconds starting at start (by default half
+    the schedule before now, so a time window trims both ends).
+    """
+    rng = random.Random(seed)
+    if start is None:
+        start = int(time.time()) // 3600 * 3600 - programmes * duration // 2
+    parts = [b'<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="bench">\n']
+    ids = [channel_id(first_channel + i) for i in range(channels)]
+    for cid in ids:
+        parts.append(b'  <channel id="%s">\n    <display-name>%s</display-name>\n  </channel>\n'
+                     % (cid.encode(), cid.encode()))
+    for cid in ids:
+        for slot in range(programmes):
+            begin = start + slot * duration
+            title = rng.choice(TITLES).encode("utf-8")
+            if malformed_rate and rng.random() < malformed_rate:
+                title += rng.choice(MALFORMED)
+            parts.append(
+                b'  <programme start="%s +0000" stop="%s +0000" channel="%s">\n'
+                b'    <title lang="en">%s</title>\n    <desc>Episode %d of %s</desc>\n  </programme>\n'
+                % (stamp(begin), stamp(begin + duration), cid.encode(), title, slot, cid.encode()))
+    parts.append(b"</tv>\n")
+    data = b"".join(parts)
+    return gzip.compress(data, compresslevel=6, mtime=0) if compress else data
+
+
+def stamp(epoch):
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(epoch)).encode()
+
+
+def make_playlist(channel_ids):
+    lines = ["#EXTM3U"]
+    for cid in channel_ids:
+        lines.append(f'#EXTINF:-1 tvg-id="{cid}" group-title="Bench",{cid}')
+        lines.append(f"http://127.0.0.1/{cid}.m3u8")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def make_source_set(sources, channels, programmes, overlap=0.5, keep=0.5, malformed_rate=0.0, seed=0):
+    """Return ({path: body}, playlist bytes) for a set of overlapping feeds.
+
+    Consecutive feeds share overlap of their channels so the merge has
+    duplicates to drop, every other feed is gzipped, and the playlist lists
+    roughly keep of all channels.
+    """
+    step = max(1, int(channels * (1 - overlap)))
+    files = {}
+    for k in range(sources):
+        compress = k % 2 == 1
+        path = f"/feed{k}.xml" + (".gz" if compress else "")
+        files[path] = make_feed(channels, programmes, first_channel=k * step, malformed_rate=malformed_rate,
+                                compress=compress, seed=seed + k)
+    total_channels = (sources - 1) * step + channels
+    every = max(1, round(1 / keep)) if keep else total_channels + 1
+    playlist = make_playlist(channel_id(n) for n in range(0, total_channels, every))
+    return files, playlist
@@ -1,10 +1,27 @@
+import argparse
+import calendar
 import os
 import gzip
+import hashlib
+import html
+import json
+import multiprocessing
+import random
 import re
 import requests
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
 import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from xml.etree import ElementTree as ET
-from io import BytesIO
 
 epg_sources = [
     "https://raw.githubusercontent.com/matthuisman/i.mjh.nz/refs/heads/master/Plex/all.xml",
@@ -49,14 +66,136 @@ epg_sources = [
 
 playlist_url = "http://drewlive24.duckdns.org:8081/DrewLive/MergedPlaylist.m3u8"
 output_filename = "DrewLive.xml.gz"
+index_filename = "DrewLive.sqlite"
 
+# Most sources live on epgshare01.online, so parallelism is capped per host
+# as well as overall to stay polite with any single server.
+FETCH_WORKERS = 16
+PER_HOST_CONNECTIONS = 4
+# Sources are loaded at most FETCH_LOOKAHEAD ahead of the one being written,
+# so a slow early source can't leave every later result waiting in memory.
+FETCH_LOOKAHEAD = 2 * FETCH_WORKERS
 
-def fix_xml_issues(xml_content):
-    """Fix common XML encoding and formatting issues for player compatibility"""
-    xml_content = xml_content.replace('&amp;amp;', '&amp;')
-    xml_content = re.sub(r'</programme>\s*<programme', '</programme>\n<programme', xml_content)
-    xml_content = re.sub(r'[^\x20-\x7E\n\r\t]', '', xml_content)
-    return xml_content
+# Failed attempts back off exponentially with full jitter. After
+# BREAKER_THRESHOLD consecutive transient failures a host's circuit opens and
+# its remaining sources are skipped. No download starts, and no retry sleeps,
+# past FETCH_BUDGET seconds into the run.
+FETCH_RETRIES = 3
+FETCH_TIMEOUT = 60
+BACKOFF_BASE = 2
+BACKOFF_MAX = 30
+BREAKER_THRESHOLD = 3
+FETCH_BUDGET = 20 * 60
+
+# With PARSE_WORKERS > 0 each downloaded source is inflated, sanitized, filtered
+# and serialized in a separate process; 0 parses in the download threads.
+PARSE_WORKERS = 0
+
+CHUNK_SIZE = 1 << 16
+COMPRESS_LEVEL = 9
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+CACHE_DIR = ".epg_cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Programmes that end before now - WINDOW_PAST_HOURS or start after
+# now + WINDOW_FUTURE_HOURS are pruned. The edges move in WINDOW_STEP_HOURS
+# steps so unchanged sources give byte-identical output between steps, and
+# sources are parsed WINDOW_SLACK_HOURS further ahead so a cached shard keeps
+# covering the window as it slides.
+WINDOW_PAST_HOURS = 6
+WINDOW_FUTURE_HOURS = 72
+WINDOW_STEP_HOURS = 6
+WINDOW_SLACK_HOURS = 24
+
+# A record's data is the serialized element and its key a 64-bit digest of its
+# identity, used by the dedup index; start/stop are epoch seconds (0 if
+# unknown, and always 0 for channels). On disk each record is a header of the
+# other fields followed by data, so cache hits never go back through the parser.
+RECORD_HEADER = struct.Struct(">BQqqI")
+RECORD_TAGS = ("channel", "programme")
+
+Record = namedtuple("Record", "tag key start stop data")
+SourceResult = namedtuple("SourceResult", "total records cached pruned pruned_bytes")
+SpooledBody = namedtuple("SpooledBody", "file hash headers")
+TimeWindow = namedtuple("TimeWindow", "start stop")
+Listing = namedtuple("Listing", "channel start stop title")
+
+# Fields the index pulls straight from serialized records, without reparsing
+RECORD_CHANNEL = re.compile(rb'channel="([^"]*)"')
+RECORD_ID = re.compile(rb'id="([^"]*)"')
+RECORD_TITLE = re.compile(rb'<title[^>]*>(.*?)</title>', re.S)
+RECORD_NAME = re.compile(rb'<display-name[^>]*>(.*?)</display-name>', re.S)
+
+_day_epochs = {}
+
+_host_sessions = {}
+_host_slots = {}
+_host_lock = threading.Lock()
+
+_worker_tvg_ids = None
+
+
+class XMLSanitizer:
+    """Streaming byte-level cleanup of an XMLTV body before it is parsed.
+
+    Drops the control characters XML 1.0 forbids, U+FFFE/U+FFFF and invalid
+    UTF-8 sequences, and collapses double-escaped '&amp;amp;', while keeping
+    every valid UTF-8 character. Entities are only matched once the other
+    bytes are gone. Each stage holds a few trailing bytes back between feeds
+    (a split character, then a split entity), so the output does not depend
+    on where the chunks end.
+    """
+
+    ILLEGAL_CONTROLS = bytes(b for b in range(0x20) if b not in (0x09, 0x0A, 0x0D))
+
+    def __init__(self):
+        self.pending = b""
+        self.held = b""
+
+    def feed(self, data):
+        data = self.pending + data.translate(None, self.ILLEGAL_CONTROLS)
+        cut = self._char_cut(data)
+        self.pending = data[cut:]
+        return self._entities(self._utf8(data[:cut]))
+
+    def close(self):
+        data, self.pending = self.pending, b""
+        return self._entities(self._utf8(data), final=True)
+
+    @staticmethod
+    def _char_cut(data):
+        cut = len(data)
+        for i in range(cut - 1, max(cut - 4, -1), -1):
+            byte = data[i]
+            if byte < 0x80:
+                break
+            if byte >= 0xC0:
+                needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+                if cut - i < needed:
+                    cut = i
+                break
+        return cut
+
+    @staticmethod
+    def _utf8(data):
+        if not data.isascii():
+            try:
+                data.decode("utf-8")
+            except UnicodeDecodeError:
+                data = data.decode("utf-8", errors="ignore").encode("utf-8")
+            data = data.replace(b"\xef\xbf\xbe", b"").replace(b"\xef\xbf\xbf", b"")
+        return data
+
+    def _entities(self, data, final=False):
+        data = self.held + data
+        cut = len(data)
+        if not final:
+            amp = data.rfind(b"&", max(0, cut - 8))
+            if amp != -1:
+                cut = amp
+        self.held = data[cut:]
+        return data[:cut].replace(b"&amp;amp;", b"&amp;")
 
 
 def fetch_tvg_ids_from_playlist(url):
@@ -71,76 +210,821 @@ def fetch_tvg_ids_from_playlist(url):
         return set()
 
 
-def fetch_with_retry(url, retries=3, delay=10, timeout=30):
-    for attempt in range(1, retries + 1):
+def get_host_session(url):
+    """Return the shared (session, slot) pair for the host serving url"""
+    host = urlparse(url).netloc.lower()
+    with _host_lock:
+        if host not in _host_sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PER_HOST_CONNECTIONS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _host_sessions[host] = session
+            _host_slots[host] = threading.BoundedSemaphore(PER_HOST_CONNECTIONS)
+        return _host_sessions[host], _host_slots[host]
+
+
+class FetchPolicy:
+    """Retry, backoff and circuit-breaker state shared by every download in a run"""
+
+    def __init__(self, retries=FETCH_RETRIES, base_delay=BACKOFF_BASE, max_delay=BACKOFF_MAX,
+                 breaker_threshold=BREAKER_THRESHOLD, budget=FETCH_BUDGET):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.deadline = time.monotonic() + budget
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.open_hosts = set()
+        self.skipped = 0
+        self.slept = 0.0
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def allow(self, host):
+        """True if a request to host may start now; counts the skip otherwise"""
+        with self.lock:
+            if host in self.open_hosts or self.remaining() <= 0:
+                self.skipped += 1
+                return False
+            return True
+
+    def success(self, host):
+        with self.lock:
+            self.failures[host] = 0
+
+    def failure(self, host):
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.breaker_threshold and host not in self.open_hosts:
+                self.open_hosts.add(host)
+                print(f"⛔ Circuit opened for {host} after {self.failures[host]} consecutive failures")
+
+    def backoff(self, attempt):
+        """Return the jittered delay before retry number attempt, or None if over budget"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if delay >= self.remaining():
+            return None
+        with self.lock:
+            self.slept += delay
+        return delay
+
+
+def is_transient(error):
+    """True for errors that say the host is struggling rather than the request being wrong"""
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status >= 500 or status in (408, 429)
+    return isinstance(error, requests.RequestException)
+
+
+def fetch_with_retry(url, policy, consume, timeout=FETCH_TIMEOUT, headers=None):
+    """GET url under policy, handing the streamed response to consume.
+
+    The host slot is held for as long as consume runs, which includes any
+    parsing it does, but not while backing off between attempts. Requests are skipped once the host's
+    circuit is open or the run's budget is spent, and errors that aren't
+    transient are not retried.
+    """
+    session, slot = get_host_session(url)
+    host = urlparse(url).netloc.lower()
+    for attempt in range(1, policy.retries + 1):
         try:
-            r = requests.get(url, timeout=timeout)
-            r.raise_for_status()
-            return r
+            with slot:
+                if not policy.allow(host):
+                    print(f"⛔ Skipping {url}: circuit open or fetch budget spent")
+                    return None
+                request_timeout = max(1, min(timeout, policy.remaining()))
+                with session.get(url, headers=headers, timeout=request_timeout, stream=True) as r:
+                    r.raise_for_status()
+                    result = consume(url, r)
+            policy.success(host)
+            return result
         except Exception as e:
             print(f"⚠️ Attempt {attempt} failed for {url}: {e}")
-            if attempt < retries:
+            if not is_transient(e):
+                return None
+            policy.failure(host)
+            if attempt < policy.retries:
+                delay = policy.backoff(attempt)
+                if delay is None:
+                    print(f"⌛ Fetch budget spent, giving up on {url}")
+                    return None
                 time.sleep(delay)
     return None
 
 
-def stream_parse_epg(xml_content, valid_tvg_ids, root):
-    kept_channels = 0
-    total_items = 0
+def fetch_sources(urls, load, workers=FETCH_WORKERS, lookahead=FETCH_LOOKAHEAD):
+    """Run load(url) concurrently, yielding (url, result) in the original order.
+
+    Each distinct url is loaded once. A result is handed back as soon as it and
+    every earlier source are done, so the caller overlaps the remaining downloads.
+    No more than lookahead distinct sources are in flight or waiting to be
+    handed back, and a result is released after its url's last occurrence.
+    """
+    distinct = list(dict.fromkeys(urls))
+    last = {url: i for i, url in enumerate(urls)}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        submitted = 0
+        for i, url in enumerate(urls):
+            while submitted < len(distinct) and (url not in futures or len(futures) < max(1, lookahead)):
+                futures[distinct[submitted]] = pool.submit(load, distinct[submitted])
+                submitted += 1
+            result = futures[url].result()
+            if last[url] == i:
+                del futures[url]
+            yield url, result
+
+
+def inflate_chunks(chunks):
+    """Incrementally gunzip a byte stream, including multi-member files"""
+    inflater = zlib.decompressobj(GZIP_WBITS)
+    for data in chunks:
+        while data:
+            if inflater.eof:
+                inflater = zlib.decompressobj(GZIP_WBITS)
+            out = inflater.decompress(data)
+            if out:
+                yield out
+            data = inflater.unused_data
+    if not inflater.eof:
+        raise zlib.error("truncated gzip stream")
+
+
+def iter_file_chunks(f):
+    while True:
+        data = f.read(CHUNK_SIZE)
+        if not data:
+            return
+        yield data
+
+
+def iter_xml_chunks(chunks, url):
+    """Yield inflated, sanitized byte chunks of an EPG body"""
+    if url.endswith(".gz"):
+        chunks = inflate_chunks(chunks)
+    sanitizer = XMLSanitizer()
+    for data in chunks:
+        data = sanitizer.feed(data)
+        if data:
+            yield data
+    data = sanitizer.close()
+    if data:
+        yield data
+
+
+def parse_xmltv_time(value):
+    """Convert an XMLTV timestamp like '20251017120000 +0000' to epoch seconds.
+
+    The epoch of each calendar day is memoized, so most calls are a handful
+    of int() conversions. Returns 0 when the stamp itself can't be parsed;
+    a zone other than +HHMM/-HHMM ("Z", "UTC", missing) is taken as UTC.
+    """
+    stamp, _, tz = value.partition(" ")
+    if len(stamp) > 14:
+        stamp, tz = stamp[:14], stamp[14:]
     try:
-        tree = ET.ElementTree(ET.fromstring(xml_content))
-        for child in tree.getroot():
-            if child.tag in ('channel', 'programme'):
+        day = _day_epochs.get(stamp[:8])
+        if day is None:
+            day = calendar.timegm((int(stamp[:4]), int(stamp[4:6]), int(stamp[6:8]), 0, 0, 0))
+            _day_epochs[stamp[:8]] = day
+        seconds = day + int(stamp[8:10] or 0) * 3600 + int(stamp[10:12] or 0) * 60 + int(stamp[12:14] or 0)
+    except (ValueError, IndexError):
+        return 0
+    tz = tz.strip()
+    if len(tz) == 5 and tz[0] in "+-" and tz[1:].isdigit():
+        offset = int(tz[1:3]) * 3600 + int(tz[3:5]) * 60
+        seconds += offset if tz[0] == "-" else -offset
+    return seconds
+
+
+def in_window(start, stop, window):
+    """False only if the programme lies wholly outside window; unknown times are kept"""
+    if stop and stop <= window.start:
+        return False
+    if start and start >= window.stop:
+        return False
+    return True
+
+
+def current_window(past_hours=WINDOW_PAST_HOURS, future_hours=WINDOW_FUTURE_HOURS, step_hours=WINDOW_STEP_HOURS):
+    """Return the window around now, widened outwards to whole steps"""
+    step = max(1, step_hours * 3600)
+    now = int(time.time())
+    start = (now - past_hours * 3600) // step * step
+    stop = -(-(now + future_hours * 3600) // step) * step
+    return TimeWindow(start, stop)
+
+
+def stream_parse_epg(chunks, valid_tvg_ids, window=None):
+    """Incrementally parse XMLTV byte chunks into records for matching elements.
+
+    Each top-level element is checked as soon as it closes and then detached,
+    so memory is bounded by one element rather than the whole feed. With a
+    window, programmes outside it are dropped before they are serialized.
+    Records come back in canonical order (channels by id, then programmes by
+    channel and start) so a shard's content never depends on the feed's layout.
+    Returns (total_items, records, pruned, pruned_bytes), or None for a
+    malformed source.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    kept = []
+    total_items = 0
+    pruned = 0
+    pruned_bytes = 0
+    depth = 0
+    root = None
+
+    def drain():
+        nonlocal total_items, pruned, pruned_bytes, depth, root
+        for event, elem in parser.read_events():
+            if event == "start":
+                depth += 1
+                if root is None:
+                    root = elem
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if elem.tag in ('channel', 'programme'):
                 total_items += 1
-                tvg_id = child.get('id') or child.get('channel')
+                tvg_id = elem.get('id') or elem.get('channel')
                 if tvg_id in valid_tvg_ids:
-                    root.append(child)
-                    kept_channels += 1
+                    start = stop = 0
+                    if elem.tag == "programme":
+                        start = parse_xmltv_time(elem.get("start", ""))
+                        stop = parse_xmltv_time(elem.get("stop", ""))
+                    if window and not in_window(start, stop, window):
+                        pruned += 1
+                        pruned_bytes += len(element_bytes(elem))
+                    else:
+                        record = serialize_element(elem, start, stop)
+                        kept.append(((elem.tag != "channel", tvg_id, start, record.data), record))
+            root.clear()
+
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            drain()
+        parser.close()
+        drain()
     except ET.ParseError:
         print("❌ XML Parse Error — skipping source")
-    return total_items, kept_channels
+        return None
+    kept.sort(key=lambda item: item[0])
+    return total_items, [record for _, record in kept], pruned, pruned_bytes
+
+
+def record_key(*parts):
+    """Return a 64-bit digest identifying a channel or programme"""
+    data = "\0".join(parts).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def element_bytes(elem):
+    elem.tail = None
+    return ET.tostring(elem, encoding="unicode").encode("utf-8")
+
+
+def serialize_element(elem, start=0, stop=0):
+    if elem.tag == "channel":
+        key = record_key("C", elem.get("id", ""))
+    else:
+        key = record_key("P", elem.get("channel", ""), elem.get("start", ""), elem.get("stop", ""))
+    return Record(elem.tag, key, start, stop, element_bytes(elem))
+
+
+def parse_source(url, chunks, valid_tvg_ids, window=None):
+    """Parse a source body into a SourceResult, or None if it is unusable"""
+    try:
+        parsed = stream_parse_epg(iter_xml_chunks(chunks, url), valid_tvg_ids, window)
+    except zlib.error:
+        print(f"⚠️ Failed to decompress {url}, skipping")
+        return None
+    if parsed is None:
+        return None
+    total, records, pruned, pruned_bytes = parsed
+    return SourceResult(total, records, False, pruned, pruned_bytes)
+
+
+def write_records(path, records):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for tag, key, start, stop, data in records:
+            f.write(RECORD_HEADER.pack(RECORD_TAGS.index(tag), key, start, stop, len(data)))
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_records(path):
+    with open(path, "rb") as f:
+        buf = f.read()
+    records = []
+    pos = 0
+    while pos < len(buf):
+        code, key, start, stop, size = RECORD_HEADER.unpack_from(buf, pos)
+        pos += RECORD_HEADER.size
+        records.append(Record(RECORD_TAGS[code], key, start, stop, buf[pos:pos + size]))
+        pos += size
+    return records
+
 
+class SourceCache:
+    """Persistent per-URL store of source shards.
 
-def merge_and_filter_epg(epg_sources, playlist_url, output_file):
+    A shard is the filtered, canonically ordered records of one source, kept
+    with the HTTP validators and a hash of the body they came from. An entry
+    is only reused while the filter that produced it (the fingerprint) is
+    unchanged and the window it was parsed for still covers the current one;
+    then a 304, or a 200 whose body hashes the same, reuses the shard without
+    parsing the source. The store is trimmed to max_bytes, least recently
+    used first. With refresh set, nothing is reused but fresh shards are
+    still stored.
+    """
+
+    VERSION = 6
+
+    def __init__(self, path, fingerprint, max_bytes=CACHE_MAX_BYTES, refresh=False):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.index_path = os.path.join(path, "index.json")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        self.entries = index.get("entries", {}) if index.get("version") == self.VERSION else {}
+
+    def _file(self, url):
+        return os.path.join(self.path, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".bin")
+
+    def lookup(self, url, window=None):
+        """Return the revalidatable entry for url, or None"""
+        if self.refresh:
+            return None
+        with self.lock:
+            entry = self.entries.get(url)
+        if not entry or entry["fingerprint"] != self.fingerprint:
+            return None
+        since, horizon = entry["since"], entry["horizon"]
+        if horizon is not None and (window is None or horizon < window.stop or window.start < since):
+            return None
+        try:
+            if os.path.getsize(self._file(url)) != entry["size"]:
+                return None
+        except OSError:
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def load(self, url, entry):
+        records = read_records(self._file(url))
+        with self.lock:
+            entry["used"] = time.time()
+            self.hits += 1
+        return SourceResult(entry["total"], records, True, entry["pruned"], entry["pruned_bytes"])
+
+    def renew(self, url, entry, headers):
+        """Reuse an entry whose body came back unchanged under new validators"""
+        with self.lock:
+            entry["etag"] = headers.get("ETag")
+            entry["last_modified"] = headers.get("Last-Modified")
+        return self.load(url, entry)
+
+    def store(self, url, headers, result, body_hash, parse_window=None):
+        path = self._file(url)
+        write_records(path, result.records)
+        with self.lock:
+            self.entries[url] = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "body_hash": body_hash,
+                "fingerprint": self.fingerprint,
+                "since": parse_window.start if parse_window else None,
+                "horizon": parse_window.stop if parse_window else None,
+                "total": result.total,
+                "pruned": result.pruned,
+                "pruned_bytes": result.pruned_bytes,
+                "size": os.path.getsize(path),
+                "used": time.time(),
+            }
+            self.builds += 1
+
+    def save(self):
+        """Evict least recently used entries over max_bytes and write the index"""
+        with self.lock:
+            total = sum(e["size"] for e in self.entries.values())
+            for url, entry in sorted(self.entries.items(), key=lambda kv: kv[1]["used"]):
+                if total <= self.max_bytes:
+                    break
+                total -= entry["size"]
+                del self.entries[url]
+                try:
+                    os.remove(self._file(url))
+                except OSError:
+                    pass
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "entries": self.entries}, f)
+            os.replace(tmp_path, self.index_path)
+
+
+def filter_fingerprint(valid_tvg_ids):
+    return hashlib.sha1("\n".join(sorted(valid_tvg_ids)).encode("utf-8")).hexdigest()
+
+
+def spool_body(resp):
+    """Copy a response body to a named temporary file, hashing it on the way"""
+    digest = hashlib.sha256()
+    body = tempfile.NamedTemporaryFile()
+    try:
+        for data in resp.iter_content(CHUNK_SIZE):
+            digest.update(data)
+            body.write(data)
+        body.flush()
+    except BaseException:
+        body.close()
+        raise
+    return SpooledBody(body, digest.hexdigest(), resp.headers)
+
+
+def init_parse_worker(valid_tvg_ids):
+    global _worker_tvg_ids
+    _worker_tvg_ids = valid_tvg_ids
+
+
+def parse_file(path, url, window=None):
+    """Parse a spooled source body inside a parse worker process"""
+    with open(path, "rb") as f:
+        return parse_source(url, iter_file_chunks(f), _worker_tvg_ids, window)
+
+
+def load_source(url, valid_tvg_ids, policy, cache=None, window=None, parse_pool=None):
+    """Fetch and filter one source, reusing its cached shard when possible.
+
+    Without a cache or parse pool the body is parsed as it streams in, so
+    the host slot stays held for the parse. Otherwise it is spooled to disk
+    inside the host slot and parsed after the slot is released, in
+    parse_pool when one is given.
+    """
+    entry = cache.lookup(url, window) if cache else None
+    parse_window = None
+    if window:
+        parse_window = TimeWindow(window.start, window.stop + WINDOW_SLACK_HOURS * 3600)
+
+    def consume(url, resp):
+        if entry and resp.status_code == 304:
+            return cache.load(url, entry)
+        if not cache and not parse_pool:
+            return parse_source(url, resp.iter_content(CHUNK_SIZE), valid_tvg_ids, parse_window)
+        return spool_body(resp)
+
+    headers = SourceCache.conditional_headers(entry) if entry else None
+    fetched = fetch_with_retry(url, policy, consume=consume, headers=headers)
+    if not isinstance(fetched, SpooledBody):
+        return fetched
+
+    with fetched.file as body:
+        # A server without validators still only costs a download when nothing changed
+        if entry and entry.get("body_hash") == fetched.hash:
+            return cache.renew(url, entry, fetched.headers)
+        if parse_pool:
+            result = parse_pool.submit(parse_file, body.name, url, parse_window).result()
+        else:
+            body.seek(0)
+            result = parse_source(url, iter_file_chunks(body), valid_tvg_ids, parse_window)
+    if cache and result is not None:
+        cache.store(url, fetched.headers, result, fetched.hash, parse_window)
+    return result
+
+
+class DedupIndex:
+    """Set of record keys already written, shared by every source in a run.
+
+    Channels are keyed on their id and programmes on (channel, start, stop),
+    so the first source to deliver an item wins and later copies are dropped.
+    Which source comes first is decided by order_sources.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.dropped = {"channel": 0, "programme": 0}
+
+    def accept(self, tag, key):
+        if key in self.seen:
+            self.dropped[tag] += 1
+            return False
+        self.seen.add(key)
+        return True
+
+
+def order_sources(sources, precedence="first", preferred=()):
+    """Order sources so the one that should win a duplicate is merged first.
+
+    precedence "first" keeps the list order and "last" reverses it. Sources
+    whose URL contains one of the preferred substrings move ahead of the
+    rest, ranked by their position in preferred.
+    """
+    if precedence not in ("first", "last"):
+        raise ValueError(f"unknown precedence: {precedence}")
+    ordered = list(reversed(sources)) if precedence == "last" else list(sources)
+
+    def rank(url):
+        for i, pattern in enumerate(preferred):
+            if pattern in url:
+                return i
+        return len(preferred)
+
+    return sorted(ordered, key=rank)
+
+
+class XMLTVWriter:
+    """Write a merged XMLTV guide to a gzip file as elements are accepted.
+
+    Channels go straight to the output while programmes are spooled to a
+    temporary file and appended after the last channel, so the guide lists
+    all channels first without the merged tree ever being held in memory.
+    The gzip header carries a fixed mtime, so identical input gives
+    byte-identical output. The file is written under a temporary name and
+    moved into place on close.
+    """
+
+    def __init__(self, path, compresslevel=COMPRESS_LEVEL):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.raw = open(self.tmp_path, "wb")
+        self.out = gzip.GzipFile(os.path.basename(path), "wb", compresslevel, self.raw, mtime=0)
+        self.spool = tempfile.TemporaryFile()
+        self.channels = 0
+        self.programmes = 0
+        self.out.write(b"<?xml version='1.0' encoding='utf-8'?>\n<tv>\n")
+
+    def add(self, tag, data):
+        if tag == "channel":
+            self.out.write(data + b"\n")
+            self.channels += 1
+        else:
+            self.spool.write(data + b"\n")
+            self.programmes += 1
+
+    def close(self):
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, self.out)
+        self.spool.close()
+        self.out.write(b"</tv>\n")
+        self.out.close()
+        self.raw.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.spool.close()
+        self.out.close()
+        self.raw.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def record_field(pattern, data):
+    match = pattern.search(data)
+    return html.unescape(match.group(1).decode("utf-8")) if match else ""
+
+
+class EPGIndexWriter:
+    """Build a SQLite now/next index alongside the merged XMLTV file.
+
+    Fed the same records as XMLTVWriter, in the same pass. Programmes are
+    stored in a WITHOUT ROWID table clustered on (channel, start, stop), so
+    EPGIndex lookups are single index seeks. Written under a temporary name
+    and moved into place on close.
+    """
+
+    BATCH = 5000
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.db = sqlite3.connect(self.tmp_path)
+        self.db.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE channels (id TEXT PRIMARY KEY, name TEXT) WITHOUT ROWID;
+            CREATE TABLE programmes (
+                channel TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                stop INTEGER NOT NULL,
+                title TEXT,
+                PRIMARY KEY (channel, start, stop)
+            ) WITHOUT ROWID;
+        """)
+        self.channels = []
+        self.programmes = []
+
+    def add(self, record):
+        if record.tag == "channel":
+            self.channels.append((record_field(RECORD_ID, record.data), record_field(RECORD_NAME, record.data)))
+        else:
+            self.programmes.append((record_field(RECORD_CHANNEL, record.data), record.start, record.stop,
+                                    record_field(RECORD_TITLE, record.data)))
+        if len(self.programmes) >= self.BATCH:
+            self._flush()
+
+    def _flush(self):
+        self.db.executemany("INSERT OR IGNORE INTO channels VALUES (?, ?)", self.channels)
+        self.db.executemany("INSERT OR IGNORE INTO programmes VALUES (?, ?, ?, ?)", self.programmes)
+        self.channels = []
+        self.programmes = []
+
+    def close(self):
+        self._flush()
+        self.db.commit()
+        self.db.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.db.close()
+        os.remove(self.tmp_path)
+
+
+class EPGIndex:
+    """Read-only queries against an index written by EPGIndexWriter.
+
+    Times are epoch seconds; a missing programme is returned as None.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def close(self):
+        self.db.close()
+
+    def now_next(self, channel, at=None):
+        """Return (current, next) Listings for channel at the given time"""
+        at = int(time.time()) if at is None else at
+        row = self.db.execute(
+            "SELECT channel, start, stop, title FROM programmes"
+            " WHERE channel = ? AND start <= ? ORDER BY start DESC LIMIT 1", (channel, at)).fetchone()
+        current = Listing(*row) if row and row[2] > at else None
+        row = self.db.execute(
+            "SELECT channel, start, stop, title FROM programmes"
+            " WHERE channel = ? AND start > ? ORDER BY start LIMIT 1", (channel, at)).fetchone()
+        return current, Listing(*row) if row else None
+
+    def listings(self, channel, start, stop):
+        """Return Listings for channel that overlap [start, stop), in start order"""
+        rows = self.db.execute(
+            "SELECT channel, start, stop, title FROM programmes"
+            " WHERE channel = ? AND start < ? AND stop > ? ORDER BY start", (channel, stop, start))
+        return [Listing(*row) for row in rows]
+
+    def channel_name(self, channel):
+        row = self.db.execute("SELECT name FROM channels WHERE id = ?", (channel,)).fetchone()
+        return row[0] if row else None
+
+
+def merge_and_filter_epg(epg_sources, playlist_url, output_file, compresslevel=COMPRESS_LEVEL,
+                         cache_dir=CACHE_DIR, refresh=False, precedence="first", preferred=(),
+                         window_hours=(WINDOW_PAST_HOURS, WINDOW_FUTURE_HOURS, WINDOW_STEP_HOURS),
+                         parse_workers=PARSE_WORKERS, index_file=None, fetch_budget=FETCH_BUDGET):
     valid_tvg_ids = fetch_tvg_ids_from_playlist(playlist_url)
-    root = ET.Element("tv")
+    cache = SourceCache(cache_dir, filter_fingerprint(valid_tvg_ids), refresh=refresh) if cache_dir else None
+    window = current_window(*window_hours) if window_hours else None
+    policy = FetchPolicy(budget=fetch_budget)
+    dedup = DedupIndex()
     cumulative_kept = 0
     cumulative_total = 0
+    cumulative_pruned = 0
+    cumulative_pruned_bytes = 0
 
-    for url in epg_sources:
-        print(f"\n🌐 Processing: {url}")
-        resp = fetch_with_retry(url, retries=3, delay=10, timeout=60)
-        if not resp:
-            print(f"❌ Failed to fetch {url}")
-            continue
-
-        content = resp.content
-        if url.endswith(".gz"):
-            try:
-                content = gzip.decompress(content)
-            except Exception:
-                print("⚠️ Failed to decompress, skipping")
-                continue
+    parse_pool = None
+    if parse_workers > 0:
+        # Spawn rather than fork: the download threads may hold locks at fork time
+        parse_pool = ProcessPoolExecutor(parse_workers, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=init_parse_worker, initargs=(valid_tvg_ids,))
 
-        # Decode, fix XML, and re-encode for parsing
-        try:
-            xml_content = fix_xml_issues(content.decode("utf-8", errors="ignore"))
-        except Exception:
-            print("⚠️ Failed to decode XML, skipping")
-            continue
+    sources = order_sources(epg_sources, precedence, preferred)
+    results = fetch_sources(sources, partial(load_source, valid_tvg_ids=valid_tvg_ids, policy=policy,
+                                             cache=cache, window=window, parse_pool=parse_pool))
+    index = EPGIndexWriter(index_file) if index_file else None
+    try:
+        with XMLTVWriter(output_file, compresslevel=compresslevel) as writer:
+            for url, result in results:
+                print(f"\n🌐 Processing: {url}")
+                if result is None:
+                    print(f"❌ No usable data from {url}")
+                    continue
 
-        total, kept = stream_parse_epg(xml_content, valid_tvg_ids, root)
-        cumulative_total += total
-        cumulative_kept += kept
-        print(f"📊 Total items found: {total}, Kept: {kept}")
+                kept = 0
+                duplicates = 0
+                pruned = result.pruned
+                pruned_bytes = result.pruned_bytes
+                for record in result.records:
+                    # Cached records may predate the current window, so check again
+                    if window and not in_window(record.start, record.stop, window):
+                        pruned += 1
+                        pruned_bytes += len(record.data)
+                    elif dedup.accept(record.tag, record.key):
+                        writer.add(record.tag, record.data)
+                        if index:
+                            index.add(record)
+                        kept += 1
+                    else:
+                        duplicates += 1
+                cumulative_total += result.total
+                cumulative_kept += kept
+                cumulative_pruned += pruned
+                cumulative_pruned_bytes += pruned_bytes
+                if result.cached:
+                    print("♻️ Source unchanged — reused its shard")
+                print(f"📊 Total items found: {result.total}, Kept: {kept}, Duplicates dropped: {duplicates}")
+                if window:
+                    print(f"🕒 Outside time window: {pruned} programmes, {pruned_bytes / 1024:.1f} KB")
+        if index:
+            index.close()
+    except BaseException:
+        if index:
+            index.abort()
+        raise
+    finally:
+        if parse_pool:
+            parse_pool.shutdown()
 
-    with gzip.open(output_file, "wt", encoding="utf-8") as f:
-        ET.ElementTree(root).write(f, encoding="unicode", xml_declaration=True)
+    if cache:
+        cache.save()
 
     print(f"\n✅ Filtered EPG saved to: {output_file}")
     print(f"📈 Cumulative items processed: {cumulative_total}")
     print(f"📈 Total items kept: {cumulative_kept}")
+    print(f"📈 Written: {writer.channels} channels, {writer.programmes} programmes")
+    print(f"📈 Duplicates dropped: {dedup.dropped['channel']} channels, {dedup.dropped['programme']} programmes")
+    if window:
+        print(f"📈 Pruned outside time window: {cumulative_pruned} programmes, "
+              f"{cumulative_pruned_bytes / (1024 * 1024):.2f} MB")
+    if cache:
+        print(f"📈 Shards reused: {cache.hits}, rebuilt: {cache.builds}")
+    print(f"📈 Backoff sleep: {policy.slept:.1f}s, requests skipped: {policy.skipped}")
+    if policy.open_hosts:
+        print(f"⛔ Circuits opened: {', '.join(sorted(policy.open_hosts))}")
+    if index:
+        print(f"📈 Now/next index saved to: {index_file}")
 
 
 if __name__ == "__main__":
-    merge_and_filter_epg(epg_sources, playlist_url, output_filename)
+    parser = argparse.ArgumentParser(description="Merge and filter the DrewLive EPG sources")
+    parser.add_argument("--compress-level", type=int, default=COMPRESS_LEVEL,
+                        help="gzip level for the output, 1 (fastest) to 9 (smallest)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help="directory for the source cache (empty string disables it)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore cached results and download every source in full")
+    parser.add_argument("--precedence", choices=("first", "last"), default="first",
+                        help="which source wins a duplicate: earliest or latest in the source list")
+    parser.add_argument("--prefer", action="append", default=[], metavar="SUBSTRING",
+                        help="let sources whose URL contains SUBSTRING win duplicates (repeatable, highest first)")
+    parser.add_argument("--past-hours", type=int, default=WINDOW_PAST_HOURS,
+                        help="drop programmes that ended more than this many hours ago")
+    parser.add_argument("--future-hours", type=int, default=WINDOW_FUTURE_HOURS,
+                        help="drop programmes starting more than this many hours ahead")
+    parser.add_argument("--window-step", type=int, default=WINDOW_STEP_HOURS,
+                        help="move the window edges in steps of this many hours")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="parse sources in this many worker processes (0 parses in the download threads)")
+    parser.add_argument("--index", metavar="PATH", nargs="?", const=index_filename,
+                        help=f"also write a SQLite now/next index of the merged guide (default {index_filename})")
+    parser.add_argument("--fetch-budget", type=int, default=FETCH_BUDGET, metavar="SECONDS",
+                        help="stop starting downloads and retries this long into the run")
+    parser.add_argument("--no-window", action="store_true",
+                        help="keep every programme regardless of its time")
+    args = parser.parse_args()
+    merge_and_filter_epg(epg_sources, playlist_url, output_filename, compresslevel=args.compress_level,
+                         cache_dir=args.cache_dir, refresh=args.refresh,
+                         precedence=args.precedence, preferred=args.prefer,
+                         window_hours=None if args.no_window else (args.past_hours, args.future_hours, args.window_step),
+                         parse_workers=args.parse_workers, index_file=args.index,
+                         fetch_budget=args.fetch_budget)
@@ -1,12 +1,52 @@
 import asyncio
+import json
+import os
+import time
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import aiohttp
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import re 
+from scrape_common import (Deadline, PagePool, ResourceBlocker, TeamClassifier, describe_probe, m3u8_event,
+                           make_http_session, pick_stream, probe_candidates)
 
 API_URL = "https://ppv.to/api/streams"
 
+# Set PPV_LEAN=1 to abort images, fonts, media and ad/analytics hosts while scraping
+LEAN_BROWSING = os.getenv("PPV_LEAN", "0") == "1"
+
+# Iframes are scraped concurrently on a pool of this many pages. One that takes
+# longer than IFRAME_TIMEOUT seconds is abandoned and its page replaced.
+SCRAPE_CONCURRENCY = int(os.getenv("PPV_CONCURRENCY", "4"))
+IFRAME_TIMEOUT = 30
+
+# Scheduling: events are scraped from LOOKBEHIND_HOURS after their start until
+# LOOKAHEAD_HOURS before it; 24/7 channels are rescraped every
+# CHANNEL_REFRESH_MINUTES and otherwise reuse their last result. Scraping
+# stops starting new iframes RUN_BUDGET seconds into the run, live events first.
+LOOKAHEAD_HOURS = float(os.getenv("PPV_LOOKAHEAD_HOURS", "3"))
+LOOKBEHIND_HOURS = float(os.getenv("PPV_LOOKBEHIND_HOURS", "6"))
+CHANNEL_REFRESH_MINUTES = float(os.getenv("PPV_247_REFRESH_MINUTES", "180"))
+RUN_BUDGET = float(os.getenv("PPV_RUN_BUDGET", "1200"))
+CACHE_DIR = os.getenv("PPV_CACHE_DIR", ".ppv_cache")
+
+# One keep-alive session serves the API call and every stream probe
+HTTP_CONNECTIONS = 32
+HTTP_PER_HOST = 8
+API_TIMEOUT = aiohttp.ClientTimeout(total=30)
+PROBE_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# Upper bounds on event waits; each returns as soon as its event arrives
+PRE_CLICK_WAIT = 0.3
+STREAM_WAIT = 10
+# Streams kept per iframe (PPV_CANDIDATES). HLS ranking is opt-in, as in
+# streamedsu: at the default of 1 the first stream is published if its playlist
+# answers 200 or 403. With more, .m3u8 URLs seen within CANDIDATE_GRACE seconds
+# of the first are kept too, all are HLS-probed and the fastest healthy wins.
+STREAM_CANDIDATES = max(1, int(os.getenv("PPV_CANDIDATES", "1")))
+CANDIDATE_GRACE = 0.5
+LIVE_CARDS_WAIT = 3
+
 CUSTOM_HEADERS = [
     '#EXTVLCOPT:http-origin=https://ppv.to',
     '#EXTVLCOPT:http-referrer=https://ppv.to/',
@@ -93,6 +133,20 @@ COLLEGE_TEAMS = {
     "arizona state sun devils", "texas tech red raiders", "florida atlantic owls"
 }
 
+# Further leagues (NBA, NHL, MLB, ...) load from JSON files in this directory
+LEAGUES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leagues")
+
+def build_team_classifier():
+    classifier = TeamClassifier()
+    classifier.add_league("American Football", "PPVLand - NFL Action", "NFL.Dummy.us", NFL_TEAMS)
+    # College names win over NFL ones when an event mentions both
+    classifier.add_league("American Football", "PPVLand - College Football", "NCAA.Football.Dummy.us",
+                          COLLEGE_TEAMS, priority=1)
+    classifier.load_dir(LEAGUES_DIR)
+    return classifier
+
+TEAM_CLASSIFIER = build_team_classifier()
+
 def get_display_time(timestamp):
     if not timestamp or timestamp <= 0: return ""
     try:
@@ -112,80 +166,146 @@ def get_display_time(timestamp):
         return ""
 
 async def grab_m3u8_from_iframe(page, iframe_url):
-    first_url = None
+    with m3u8_event(page, ("response",)) as stream:
+        try:
+            await page.goto(iframe_url, timeout=5000, wait_until="commit")
+        except Exception:
+            pass
 
-    def handle_response(response):
-        nonlocal first_url
-        url = response.url
-
-        if ".m3u8" in url and first_url is None:
-            print(f"✅ Found M3U8 Stream: {url}")
-            first_url = url
+        if not await stream.wait(PRE_CLICK_WAIT):
             try:
-                page.remove_listener("response", handle_response)
-            except:
-                pass
-
-    page.on("response", handle_response)
-
-
-    try:
-        await page.goto(iframe_url, timeout=5000, wait_until="commit")
-    except Exception:
-        pass
-
-    try:
-        await page.wait_for_timeout(300)
-        nested_iframe = page.locator("iframe")
+                nested_iframe = page.locator("iframe")
 
-        if await nested_iframe.count() > 0:
-            await page.mouse.click(200, 200)
-        else:
-            await page.mouse.click(200, 200)
+                if await nested_iframe.count() > 0:
+                    await page.mouse.click(200, 200)
+                else:
+                    await page.mouse.click(200, 200)
 
-    except Exception as e:
-        print(f"⚠️ Clicking failed, but proceeding anyway. Error: {e}")
+            except Exception as e:
+                print(f"⚠️ Clicking failed, but proceeding anyway. Error: {e}")
 
+        if await stream.wait(STREAM_WAIT) and STREAM_CANDIDATES > 1:
+            await asyncio.sleep(CANDIDATE_GRACE)
 
-    for _ in range(400): 
-        if first_url:
-            break
-        await page.wait_for_timeout(25)
+    urls = list(dict.fromkeys(r.url for r in stream.seen))[:STREAM_CANDIDATES]
+    if urls:
+        print(f"✅ Found M3U8 Stream: {urls[0]}" + (f" (+{len(urls) - 1} more)" if len(urls) > 1 else ""))
+    return urls
 
+async def scrape_iframe(pool, iframe_url, label, deadline):
+    """Scrape one iframe on a pool page; None if the run budget ran out first"""
+    page = await pool.acquire()
+    broken = False
     try:
-        page.remove_listener("response", handle_response)
-    except:
-        pass
-
-    if not first_url:
-        return set()
-
-    valid = await check_m3u8_url(first_url, iframe_url)
-    if valid:
-        return {first_url}
-
-    return set()
+        if not deadline.left():
+            return None
+        print(f"\n🔎 Scraping stream {label}")
+        return await asyncio.wait_for(grab_m3u8_from_iframe(page, iframe_url), IFRAME_TIMEOUT)
+    except asyncio.TimeoutError:
+        broken = True
+        print(f"♻️ Page wedged on {iframe_url}, recycling it")
+        return []
+    finally:
+        await pool.release(page, broken)
+
+def schedule_priority(stream, now):
+    """Return the (tier, start) a stream is scraped in, or None to skip it.
+
+    Tier 0 is live (a Live Now card, started within the look-behind, or not
+    yet ended), tier 1 upcoming within the look-ahead or of unknown start,
+    tier 2 a 24/7 channel. Lower sorts first, so the run budget goes to live
+    and imminent events.
+    """
+    if stream["category"] == "24/7 Streams":
+        return 2, 0
+    start = stream["starts_at"]
+    if start is not None and start < 0:
+        # Live Now cards carry -1
+        return 0, now
+    if not start:
+        return 1, now
+    if start <= now:
+        ends_at = stream.get("ends_at")
+        if now - start <= LOOKBEHIND_HOURS * 3600 or (ends_at and ends_at > now):
+            return 0, start
+        return None
+    if start - now <= LOOKAHEAD_HOURS * 3600:
+        return 1, start
+    return None
 
-async def check_m3u8_url(url, referer):
+def load_channel_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_channel_cache(path, cache):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+def iframe_key(iframe_url):
+    """Normalise an iframe URL so the API list and Live Now cards dedup together"""
+    return iframe_url.split("#", 1)[0].rstrip("/")
+
+def probe_headers(referer):
+    return {"Referer": referer, "Origin": "https://" + referer.split('/')[2]}
+
+async def check_m3u8_url(session, url, referer):
+    """True if the playlist answers 200 or 403; gg.poocloud.in is trusted"""
     if "gg.poocloud.in" in url:
         return True
     try:
-        origin = "https://" + referer.split('/')[2]
-        headers = {"User-Agent": "Mozilla/5.0", "Referer": referer, "Origin": origin}
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-            async with session.get(url, headers=headers) as resp:
-                return resp.status in (200, 403)
-    except:
+        async with session.get(url, headers=probe_headers(referer), timeout=PROBE_TIMEOUT) as resp:
+            return resp.status in (200, 403)
+    except Exception:
         return False
 
-async def get_streams():
+async def rank_candidates(session, candidates):
+    """Check every scraped stream at once and pick one per iframe.
+
+    Returns the url_map build_m3u expects. With a single candidate per
+    iframe it only has to pass check_m3u8_url. With several, all are
+    HLS-probed and the fastest healthy one wins; gg.poocloud.in streams are
+    trusted, so when none passes the probe, one from that host is published.
+    """
+    jobs = list(dict.fromkeys((tuple(urls), iframe) for urls, iframe in candidates.values() if urls))
+    chosen = {}
+    if STREAM_CANDIDATES == 1:
+        print(f"\n🧪 Checking {len(jobs)} streams...")
+        results = await asyncio.gather(*(check_m3u8_url(session, urls[0], iframe) for urls, iframe in jobs))
+        for job, ok in zip(jobs, results):
+            chosen[job] = job[0][0] if ok else None
+        print(f"✅ {sum(1 for url in chosen.values() if url)} of {len(jobs)} iframes have a stream")
+    else:
+        print(f"\n🧪 Probing {sum(len(urls) for urls, _ in jobs)} candidate streams for {len(jobs)} iframes...")
+        results = await asyncio.gather(*(
+            probe_candidates(session, urls, probe_headers(iframe), PROBE_TIMEOUT) for urls, iframe in jobs
+        ))
+        healthy = 0
+        for job, probes in zip(jobs, results):
+            best = pick_stream(probes)
+            if best:
+                healthy += best.healthy
+                chosen[job] = best.url
+                print(f"📶 {describe_probe(best)}: {best.url}")
+            else:
+                chosen[job] = next((url for url in job[0] if "gg.poocloud.in" in url), None)
+        print(f"✅ {sum(1 for url in chosen.values() if url)} of {len(jobs)} iframes have a stream, "
+              f"{healthy} delivered segments")
+    url_map = {}
+    for key, (urls, iframe) in candidates.items():
+        url = chosen.get((tuple(urls), iframe))
+        url_map[key] = {url} if url else set()
+    return url_map
+
+async def get_streams(session):
     try:
-        async with aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=30),
-            headers={'User-Agent': 'Mozilla/5.0'}
-        ) as session:
-            print(f"🌐 Fetching streams from {API_URL}")
-            resp = await session.get(API_URL)
+        print(f"🌐 Fetching streams from {API_URL}")
+        async with session.get(API_URL, timeout=API_TIMEOUT) as resp:
             print(f"🔍 Response status: {resp.status}")
             if resp.status != 200:
                 print(f"❌ Error response: {await resp.text()}")
@@ -200,7 +320,10 @@ async def grab_live_now_from_html(page, base_url="https://ppv.to/"):
     live_now_streams = []
     try:
         await page.goto(base_url, timeout=20000)
-        await asyncio.sleep(3)
+        try:
+            await page.wait_for_selector("#livecards a.item-card", timeout=LIVE_CARDS_WAIT * 1000)
+        except PlaywrightTimeoutError:
+            pass
 
         live_cards = await page.query_selector_all("#livecards a.item-card")
         for card in live_cards:
@@ -246,16 +369,9 @@ def build_m3u(streams, url_map):
         logo = s.get("poster") or CATEGORY_LOGOS.get(orig_cat)
         tvg_id = CATEGORY_TVG_IDS.get(orig_cat, "24.7.Dummy.us")
 
-        if orig_cat == "American Football":
-            nl = name_lower
-            for t in NFL_TEAMS:
-                if t in nl:
-                    final_group = "PPVLand - NFL Action"
-                    tvg_id = "NFL.Dummy.us"
-            for t in COLLEGE_TEAMS:
-                if t in nl:
-                    final_group = "PPVLand - College Football"
-                    tvg_id = "NCAA.Football.Dummy.us"
+        league = TEAM_CLASSIFIER.classify(name_lower, orig_cat)
+        if league:
+            final_group, tvg_id = league
         
         display_name = s["name"]
         if s.get("category") != "24/7 Streams":
@@ -274,7 +390,12 @@ def build_m3u(streams, url_map):
 
 async def main():
     print("🚀 Starting PPV Stream Fetcher")
-    data = await get_streams()
+    async with make_http_session(HTTP_CONNECTIONS, HTTP_PER_HOST, {'User-Agent': 'Mozilla/5.0'}) as session:
+        await run(session)
+
+async def run(session):
+    deadline = Deadline(RUN_BUDGET)
+    data = await get_streams(session)
     if not data or "streams" not in data:
         print("❌ No valid data received from API")
         return
@@ -306,6 +427,7 @@ async def main():
                     "category": cat,
                     "poster": poster,
                     "starts_at": sort_key, 
+                    "ends_at": stream.get("ends_at"),
                     "clock_time": clock_str
                 })
 
@@ -324,28 +446,80 @@ async def main():
     async with async_playwright() as p:
         browser = await p.firefox.launch(headless=True)
         context = await browser.new_context()
-        page = await context.new_page()
-
-        url_map = {}
-        total = len(streams)
-
-        for idx, s in enumerate(streams, start=1):
-            display_name = s['name']
-            if s.get("category") != "24/7 Streams" and s.get("clock_time"):
-                 display_name = f"{s['name']} [{s['clock_time']}]"
-            
-            print(f"\n🔎 Scraping stream {idx}/{total}: {display_name} [{s['category']}]")
-
+        blocker = None
+        if LEAN_BROWSING:
+            blocker = ResourceBlocker()
+            await blocker.attach(context)
+        pool = PagePool(context, SCRAPE_CONCURRENCY)
+
+        page = await pool.acquire()
+        try:
+            live_now = await grab_live_now_from_html(page)
+        finally:
+            await pool.release(page)
+
+        # Each distinct iframe is scraped once, whichever lists it appears in,
+        # in the order of its most urgent stream
+        now = time.time()
+        channel_path = os.path.join(CACHE_DIR, "channels.json")
+        channel_cache = load_channel_cache(channel_path)
+        jobs = {}
+        channels = set()
+        scraped = {}
+        out_of_window = 0
+        for s in live_now + streams:
+            iframe = iframe_key(s["iframe"])
+            priority = schedule_priority(s, now)
+            if priority is None:
+                out_of_window += 1
+                continue
+            if priority[0] == 2:
+                channels.add(iframe)
+                cached = channel_cache.get(iframe)
+                if iframe not in jobs and cached and cached["urls"] and \
+                        now - cached["scraped"] < CHANNEL_REFRESH_MINUTES * 60:
+                    scraped[iframe] = cached["urls"]
+                    continue
+            if iframe in scraped:
+                continue
+            if iframe not in jobs or priority < jobs[iframe][2]:
+                display_name = s['name']
+                if s.get("category") != "24/7 Streams" and s.get("clock_time"):
+                    display_name = f"{s['name']} [{s['clock_time']}]"
+                jobs[iframe] = (s["iframe"], f"{display_name} [{s['category']}]", priority)
+        order = sorted(jobs, key=lambda iframe: jobs[iframe][2])
+        total = len(order)
+        print(f"\n🗓️ Scheduling {total} iframes: "
+              f"{sum(1 for i in order if jobs[i][2][0] == 0)} live, {sum(1 for i in order if jobs[i][2][0] == 1)} upcoming, "
+              f"{sum(1 for i in order if jobs[i][2][0] == 2)} 24/7 due; {len(scraped)} 24/7 reused, "
+              f"{out_of_window} streams outside the window")
+        print(f"🧵 Scraping {SCRAPE_CONCURRENCY} at a time, {deadline.left():.0f} s of budget left")
+        # The pool hands out pages first come first served, so scrapes start in priority order
+        found = await asyncio.gather(*(
+            scrape_iframe(pool, jobs[iframe][0], f"{idx}/{total}: {jobs[iframe][1]}", deadline)
+            for idx, iframe in enumerate(order, start=1)
+        ))
+        await pool.close()
+        over_budget = 0
+        for iframe, urls in zip(order, found):
+            if urls is None:
+                over_budget += 1
+                # A due 24/7 channel the budget didn't reach keeps its last known URLs
+                if iframe in channel_cache:
+                    scraped[iframe] = channel_cache[iframe]["urls"]
+                continue
+            scraped[iframe] = urls
+            if iframe in channels:
+                channel_cache[iframe] = {"urls": urls, "scraped": now}
+        if over_budget:
+            print(f"⌛ Run budget spent; {over_budget} lowest-priority iframes not scraped")
+        # Stale entries stay as a fallback; only channels no longer listed are dropped
+        save_channel_cache(channel_path, {k: v for k, v in channel_cache.items() if k in channels})
+
+        candidates = {}
+        for s in live_now + streams:
             key = f"{s['name']}::{s['category']}::{s['iframe']}"
-            url_map[key] = await grab_m3u8_from_iframe(page, s["iframe"])
-
-      
-
-        live_now = await grab_live_now_from_html(page)
-
-        for s in live_now:
-            key = f"{s['name']}::{s['category']}::{s['iframe']}"
-            url_map[key] = await grab_m3u8_from_iframe(page, s["iframe"])
+            candidates[key] = (scraped.get(iframe_key(s["iframe"]), []), s["iframe"])
 
         for s in live_now:
             s["category"] = "Live Now"
@@ -353,6 +527,10 @@ async def main():
         streams = live_now + streams 
 
         await browser.close()
+        if blocker:
+            print(blocker.summary())
+
+    url_map = await rank_candidates(session, candidates)
 
     print("\n💾 Writing final playlist to PPVLand.m3u8 ...")
     playlist = build_m3u(streams, url_map)
@@ -0,0 +1,390 @@
+"""Helpers shared by the Playwright stream scrapers (streamedsu.py, ppv.py)."""
+import asyncio
+import glob
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+
+# Lean browsing: what an embed page never needs to reveal its stream URL
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+BLOCKED_HOSTS = [
+    "doubleclick.net", "googlesyndication.com", "google-analytics.com", "googletagmanager.com",
+    "googleadservices.com", "adservice.google.com", "prd.jwpltx.com", "popads.net", "popcash.net",
+    "propellerads.com", "adsterra.com", "exoclick.com", "juicyads.com", "hilltopads.net",
+    "onclickads.net", "mc.yandex.ru", "scorecardresearch.com", "histats.com", "disqus.com",
+]
+# Comma-separated extra hosts to block, e.g. SCRAPER_BLOCK_HOSTS="ads.example.com,tracker.net"
+EXTRA_BLOCKED_HOSTS = [h.strip() for h in os.getenv("SCRAPER_BLOCK_HOSTS", "").split(",") if h.strip()]
+
+
+class ResourceBlocker:
+    """Context route handler that aborts requests a stream scrape doesn't need.
+
+    A request is aborted when its host (or a parent domain) is in hosts or
+    its resource type is in resource_types. Off the blocked hosts, anything
+    mentioning .m3u8 goes through whatever its type, so stream detection
+    keeps working; on them it is still aborted, since analytics pings such as
+    jwplayer's carry the stream URL in their query string. Counters record
+    what was blocked; summary() formats them for the run log.
+    """
+
+    def __init__(self, resource_types=BLOCKED_RESOURCE_TYPES, hosts=None):
+        self.resource_types = frozenset(resource_types)
+        self.hosts = frozenset(h.lower() for h in (BLOCKED_HOSTS + EXTRA_BLOCKED_HOSTS if hosts is None else hosts))
+        self.by_type = 0
+        self.by_host = 0
+        self.allowed = 0
+
+    def reason(self, url, resource_type):
+        """Return "host" or "type" if the request should be blocked, else None"""
+        labels = (urlsplit(url).hostname or "").split(".")
+        for i in range(len(labels) - 1):
+            if ".".join(labels[i:]) in self.hosts:
+                return "host"
+        if ".m3u8" in url:
+            return None
+        if resource_type in self.resource_types:
+            return "type"
+        return None
+
+    async def handle(self, route):
+        request = route.request
+        reason = self.reason(request.url, request.resource_type)
+        try:
+            if reason == "host":
+                self.by_host += 1
+                await route.abort("blockedbyclient")
+            elif reason == "type":
+                self.by_type += 1
+                await route.abort("blockedbyclient")
+            else:
+                self.allowed += 1
+                await route.continue_()
+        except Exception:
+            # The page closed under the request; nothing left to route
+            pass
+
+    async def attach(self, context):
+        await context.route("**/*", self.handle)
+
+    def summary(self):
+        return (f"🚫 Lean mode blocked {self.by_type + self.by_host} requests "
+                f"({self.by_type} by type, {self.by_host} by host), {self.allowed} allowed")
+
+
+class PagePool:
+    """Bounded pool of reusable pages on one browser context.
+
+    acquire() hands out an idle page, opening a new one while fewer than
+    size are in use, and waits otherwise. A page released as broken is
+    closed instead of reused, so a wedged embed can't poison later scrapes.
+    """
+
+    def __init__(self, ctx, size):
+        self.ctx = ctx
+        self.slots = asyncio.Semaphore(size)
+        self.idle = []
+        self.recycled = 0
+
+    async def acquire(self):
+        await self.slots.acquire()
+        try:
+            while self.idle:
+                page = self.idle.pop()
+                if not page.is_closed():
+                    return page
+            return await self.ctx.new_page()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    async def release(self, page, broken=False):
+        try:
+            if broken or page.is_closed():
+                self.recycled += 1
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            else:
+                self.idle.append(page)
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        for page in self.idle:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self.idle = []
+
+
+def make_http_session(limit, limit_per_host, headers=None):
+    """One keep-alive pool for a whole run; timeouts are set per request"""
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, headers=headers)
+
+
+class FirstEvent:
+    """Future resolved by the first page event whose payload passes match.
+
+    Listens from construction until close(); use as a context manager so the
+    listeners never outlive one scrape on a reused page. wait() returns the
+    payload as soon as it arrives, or None when timeout runs out first. Every
+    matching payload, the first included, is also kept in seen.
+    """
+
+    def __init__(self, page, events, match=None):
+        self.page = page
+        self.events = events
+        self.match = match
+        self.seen = []
+        self.future = asyncio.get_running_loop().create_future()
+        for event in events:
+            page.on(event, self._on_event)
+
+    def _on_event(self, payload):
+        if self.match is None or self.match(payload):
+            self.seen.append(payload)
+            if not self.future.done():
+                self.future.set_result(payload)
+
+    @property
+    def fired(self):
+        return self.future.done()
+
+    @property
+    def value(self):
+        return self.future.result() if self.future.done() else None
+
+    async def wait(self, timeout):
+        await wait_first((self,), timeout)
+        return self.value
+
+    def close(self):
+        for event in self.events:
+            try:
+                self.page.remove_listener(event, self._on_event)
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def m3u8_event(page, events=("request",), ignore=()):
+    """FirstEvent for the first request/response whose URL is an .m3u8"""
+    def match(r):
+        return ".m3u8" in r.url and not any(part in r.url for part in ignore)
+    return FirstEvent(page, events, match)
+
+
+async def wait_first(signals, timeout):
+    """Return once any of the FirstEvent signals fires or timeout seconds pass"""
+    futures = [s.future for s in signals]
+    if timeout > 0 and not any(f.done() for f in futures):
+        await asyncio.wait(futures, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+
+class Deadline:
+    """Overall time limit; left(cap) is what remains of it, at most cap seconds"""
+
+    def __init__(self, seconds):
+        self.end = time.monotonic() + seconds
+
+    def left(self, cap=None):
+        remaining = max(0.0, self.end - time.monotonic())
+        return remaining if cap is None else min(cap, remaining)
+
+
+async def probe_playlist(session, url, headers, timeout):
+    """True if url answers 200 with a body that starts like an HLS playlist.
+
+    Only the first bytes are read, so a large playlist costs no more than a
+    small one, and an error page served with any status is rejected.
+    """
+    try:
+        body, _, _ = await timed_get(session, url, headers, timeout, 64)
+        return looks_like_playlist(body)
+    except Exception:
+        return False
+
+
+TOKEN_RE = re.compile(r"[a-z0-9&]+")
+
+
+def name_tokens(text):
+    """Lower-case word tokens of text, accents folded, punctuation dropped"""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return TOKEN_RE.findall(text)
+
+
+class TeamClassifier:
+    """Route event names to a league by the team names they mention.
+
+    Team names are indexed per category as token tuples, so classify()
+    looks up each run of tokens in the name once, for each distinct team
+    name length. Its cost does not depend on the number of teams, and
+    matches always fall on word boundaries. When a name mentions teams of
+    several leagues, the league with the highest priority wins.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.lengths = {}
+
+    def add_league(self, category, group, tvg_id, teams, priority=0):
+        index = self.index.setdefault(category, {})
+        lengths = self.lengths.setdefault(category, set())
+        league = (priority, group, tvg_id)
+        for team in teams:
+            tokens = tuple(name_tokens(team))
+            if tokens and (tokens not in index or index[tokens][0] < priority):
+                index[tokens] = league
+                lengths.add(len(tokens))
+
+    def load_dir(self, path):
+        """Add every league described by a *.json file in path.
+
+        Each file holds one object, or a list of them, with category,
+        group, tvg_id, teams and an optional priority.
+        """
+        for file in sorted(glob.glob(os.path.join(path, "*.json"))):
+            with open(file, encoding="utf-8") as f:
+                data = json.load(f)
+            for league in data if isinstance(data, list) else [data]:
+                self.add_league(league["category"], league["group"], league["tvg_id"],
+                                league["teams"], league.get("priority", 0))
+
+    def classify(self, name, category):
+        """Return (group, tvg_id) of the best league named in name, or None"""
+        index = self.index.get(category)
+        if not index:
+            return None
+        tokens = name_tokens(name)
+        lengths = sorted(self.lengths[category], reverse=True)
+        best = None
+        for i in range(len(tokens)):
+            for n in lengths:
+                league = index.get(tuple(tokens[i:i + n]))
+                if league and (best is None or league[0] > best[0]):
+                    best = league
+        return best[1:] if best else None
+
+
+# HLS health probing: master playlist, first variant, first media segment
+HLS_PLAYLIST_LIMIT = 256 * 1024
+HLS_SEGMENT_BYTES = 512 * 1024
+
+HLSProbe = namedtuple("HLSProbe", "url playlist_ok healthy ttfb startup throughput variants error")
+
+
+def looks_like_playlist(body):
+    return body.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"#EXTM3U")
+
+
+def playlist_uris(text):
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+
+
+async def timed_get(session, url, headers, timeout, limit):
+    """GET up to limit bytes of url; return (body, seconds to first byte, seconds in total)"""
+    start = time.perf_counter()
+    async with session.get(url, headers=headers, timeout=timeout) as res:
+        if res.status != 200:
+            raise ValueError(f"HTTP {res.status} from {url}")
+        chunks = []
+        size = 0
+        ttfb = None
+        while size < limit:
+            chunk = await res.content.read(limit - size)
+            if not chunk:
+                break
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            chunks.append(chunk)
+            size += len(chunk)
+    total = time.perf_counter() - start
+    return b"".join(chunks), total if ttfb is None else ttfb, total
+
+
+async def probe_hls(session, url, headers, timeout):
+    """Follow url down to its first media segment and time the way there.
+
+    playlist_ok means url itself served an HLS playlist (the old acceptance
+    test); healthy means a segment arrived as well. ttfb is the first
+    playlist's time to first byte, startup the time until the first segment
+    byte (roughly what a player waits), throughput the segment read rate in
+    bytes per second. variants lists the variant URLs of a master playlist.
+    """
+    start = time.perf_counter()
+    playlist_ok = False
+    ttfb = None
+    variants = ()
+    try:
+        body, ttfb, _ = await timed_get(session, url, headers, timeout, HLS_PLAYLIST_LIMIT)
+        if not looks_like_playlist(body):
+            raise ValueError("not an HLS playlist")
+        playlist_ok = True
+        media_url, text = url, body.decode("utf-8", "ignore")
+        if "#EXT-X-STREAM-INF" in text:
+            variants = tuple(urljoin(url, uri) for uri in playlist_uris(text))
+            if not variants:
+                raise ValueError("master playlist lists no variants")
+            media_url = variants[0]
+            body, _, _ = await timed_get(session, media_url, headers, timeout, HLS_PLAYLIST_LIMIT)
+            if not looks_like_playlist(body):
+                raise ValueError("variant is not an HLS playlist")
+            text = body.decode("utf-8", "ignore")
+        segments = playlist_uris(text)
+        if not segments:
+            raise ValueError("playlist lists no segments")
+        segment_start = time.perf_counter()
+        data, segment_ttfb, segment_total = await timed_get(
+            session, urljoin(media_url, segments[0]), headers, timeout, HLS_SEGMENT_BYTES)
+        if not data:
+            raise ValueError("empty segment")
+        startup = segment_start - start + segment_ttfb
+        return HLSProbe(url, True, True, ttfb, startup, len(data) / segment_total, variants, None)
+    except Exception as e:
+        return HLSProbe(url, playlist_ok, False, ttfb, None, None, variants, str(e) or type(e).__name__)
+
+
+async def probe_candidates(session, urls, headers, timeout):
+    """Probe every distinct URL at once; probes come back in the order given"""
+    urls = list(dict.fromkeys(urls))
+    return await asyncio.gather(*(probe_hls(session, url, headers, timeout) for url in urls))
+
+
+def pick_stream(probes):
+    """Return the probe to publish: the fastest healthy stream, by startup.
+
+    A variant of another candidate's master is skipped in favour of the
+    master, so players keep adaptive bitrate. With nothing healthy, the first
+    candidate whose playlist loaded is kept, as before probing existed.
+    """
+    nested = {v for p in probes for v in p.variants}
+    healthy = [p for p in probes if p.healthy]
+    healthy = [p for p in healthy if p.url not in nested] or healthy
+    if healthy:
+        return min(healthy, key=lambda p: (p.startup, -p.throughput))
+    return next((p for p in probes if p.playlist_ok), None)
+
+
+def describe_probe(probe):
+    if probe.healthy:
+        return (f"startup {probe.startup * 1000:.0f} ms, ttfb {probe.ttfb * 1000:.0f} ms, "
+                f"{probe.throughput / 1e6:.2f} MB/s")
+    return f"unhealthy: {probe.error}"
@@ -1,13 +1,76 @@
+import aiohttp
 import asyncio
+import html as htmllib
+import json
+import os
 import re
-import requests
+import time
 from datetime import datetime
+from urllib.parse import urljoin
 from playwright.async_api import async_playwright
+from scrape_common import (Deadline, FirstEvent, PagePool, ResourceBlocker, describe_probe, m3u8_event,
+                           make_http_session, pick_stream, probe_candidates, probe_playlist, wait_first)
 
 total_matches = 0
 total_embeds = 0
 total_streams = 0
 total_failures = 0
+total_cache_hits = 0
+total_cache_misses = 0
+# Embeds resolved by each resolver tier, in the order the tiers are tried
+tier_hits = {"html": 0, "iframe": 0, "browser": 0, "browser-regex": 0}
+
+# Matches are scraped concurrently on a pool of this many pages. An embed that
+# takes longer than EMBED_TIMEOUT seconds is abandoned and its page replaced.
+MATCH_CONCURRENCY = int(os.getenv("STREAMEDSU_CONCURRENCY", "4"))
+EMBED_TIMEOUT = 30
+# Once the player controls are clicked an embed gets STREAM_DEADLINE seconds to
+# request its stream. The waits below are upper bounds and end early as soon as
+# the event arrives.
+STREAM_DEADLINE = 6
+AD_TAB_WAIT = 3
+REARM_WAIT = 1
+STREAM_WAIT = 1
+# Embeds of one match tried at once (STREAMEDSU_RACE), each on its own page; 1
+# keeps them sequential. When one wins, better-ranked embeds still running get
+# RACE_GRACE seconds to finish, so a near tie goes to the preferred embed.
+EMBED_RACE = max(1, int(os.getenv("STREAMEDSU_RACE", "1")))
+RACE_GRACE = 0.5
+# Streams resolved per match (STREAMEDSU_CANDIDATES). HLS ranking is opt-in:
+# only with more than one are the candidates probe_hls-ranked and the fastest
+# healthy stream published. At the default of 1 the first stream found wins
+# unranked, and a stream reused from the cache only ever gets a playlist probe.
+STREAM_CANDIDATES = max(1, int(os.getenv("STREAMEDSU_CANDIDATES", "1")))
+# Set STREAMEDSU_LEAN=1 to abort images, fonts, media and ad/analytics hosts
+LEAN_BROWSING = os.getenv("STREAMEDSU_LEAN", "0") == "1"
+
+# One keep-alive pool serves every API and logo request; timeouts are per request
+HTTP_CONNECTIONS = 32
+HTTP_PER_HOST = 16
+MATCHES_TIMEOUT = aiohttp.ClientTimeout(total=10)
+EMBED_API_TIMEOUT = aiohttp.ClientTimeout(total=6)
+LOGO_TIMEOUT = aiohttp.ClientTimeout(total=2)
+
+# Logo checks persist between runs: a working logo is trusted for LOGO_TTL
+# seconds, a failed one only for LOGO_FAIL_TTL so it is retried soon.
+CACHE_DIR = os.getenv("STREAMEDSU_CACHE_DIR", ".streamedsu_cache")
+LOGO_TTL = 7 * 24 * 3600
+LOGO_FAIL_TTL = 3600
+# A resolved stream is reused for up to STREAM_TTL seconds after it was
+# resolved, as long as it still answers a playlist probe; misses, expired
+# entries and failed probes are resolved again.
+STREAM_TTL = 4 * 3600
+PROBE_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+# Before the browser, embeds are fetched over plain HTTP and searched for a
+# stream URL, following up to NESTED_IFRAMES iframes one level deep. The whole
+# tier gets HTTP_TIER_TIMEOUT seconds per embed; STREAMEDSU_HTTP_TIER=0 skips it.
+HTTP_TIER = os.getenv("STREAMEDSU_HTTP_TIER", "1") == "1"
+HTTP_TIER_TIMEOUT = 8
+EMBED_HTML_TIMEOUT = aiohttp.ClientTimeout(total=5)
+NESTED_IFRAMES = 2
+M3U8_RE = re.compile(r'https?://[^\s\"\'<>]+\.m3u8(?:\?[^\"\'<>]*)?')
+IFRAME_RE = re.compile(r'<iframe[^>]+src\s*=\s*["\']([^"\']+)', re.I)
 
 CUSTOM_HEADERS = {
     "Origin": "https://embedsports.top",
@@ -50,15 +113,15 @@ def strip_non_ascii(text: str) -> str:
         return ""
     return re.sub(r"[^\x00-\x7F]+", "", text)
 
-def get_all_matches():
+async def get_all_matches(session):
     endpoints = ["live"]
     all_matches = []
     for ep in endpoints:
         try:
             print(f"📡 Fetching {ep} matches...")
-            res = requests.get(f"https://streami.su/api/matches/{ep}", timeout=10)
-            res.raise_for_status()
-            data = res.json()
+            async with session.get(f"https://streami.su/api/matches/{ep}", timeout=MATCHES_TIMEOUT) as res:
+                res.raise_for_status()
+                data = await res.json(content_type=None)
             print(f"✅ {ep}: {len(data)} matches")
             all_matches.extend(data)
         except Exception as e:
@@ -66,188 +129,435 @@ def get_all_matches():
     print(f"🎯 Total matches collected: {len(all_matches)}")
     return all_matches
 
-def get_embed_urls_from_api(source):
+async def get_embed_urls_from_api(session, source):
     try:
         s_name, s_id = source.get("source"), source.get("id")
         if not s_name or not s_id:
             return []
-        res = requests.get(f"https://streamed.pk/api/stream/{s_name}/{s_id}", timeout=6)
-        res.raise_for_status()
-        data = res.json()
+        async with session.get(f"https://streamed.pk/api/stream/{s_name}/{s_id}", timeout=EMBED_API_TIMEOUT) as res:
+            res.raise_for_status()
+            data = await res.json(content_type=None)
         return [d.get("embedUrl") for d in data if d.get("embedUrl")]
     except Exception:
         return []
 
+async def prefetch_embeds(session, matches):
+    """Look up the embed URLs of every source of every match at once.
+
+    Returns one list per match, each holding one list of embed URLs per
+    source in the match's own source order.
+    """
+    print(f"📡 Prefetching embeds for {sum(len(m.get('sources', [])) for m in matches)} sources...")
+    per_match = await asyncio.gather(*(
+        asyncio.gather(*(get_embed_urls_from_api(session, s) for s in m.get("sources", [])))
+        for m in matches
+    ))
+    return [list(sources) for sources in per_match]
+
 async def extract_m3u8(page, embed_url):
     global total_failures
-    found = None
-    try:
-        async def on_request(request):
-            nonlocal found
-            if ".m3u8" in request.url and not found:
-                if "prd.jwpltx.com" in request.url:
-                    return
-                found = request.url
-                print(f"  ⚡ Stream: {found}")
+    # Only this page's own popups count as ad tabs; other pool pages share the context
+    with m3u8_event(page, ignore=("prd.jwpltx.com",)) as stream, FirstEvent(page, ("popup",)) as popup:
+        try:
+            await page.goto(embed_url, wait_until="domcontentloaded", timeout=5000)
+            if not stream.fired:
+                await page.bring_to_front()
 
-        page.on("request", on_request)
-        await page.goto(embed_url, wait_until="domcontentloaded", timeout=5000)
-        await page.bring_to_front()
-
-        selectors = [
-            "div.jw-icon-display[role='button']",
-            ".jw-icon-playback",
-            ".vjs-big-play-button",
-            ".plyr__control",
-            "div[class*='play']",
-            "div[role='button']",
-            "button",
-            "canvas"
-        ]
-        for sel in selectors:
-            try:
-                el = await page.query_selector(sel)
-                if el:
-                    await el.click(timeout=300)
-                    break
-            except:
-                continue
+                selectors = [
+                    "div.jw-icon-display[role='button']",
+                    ".jw-icon-playback",
+                    ".vjs-big-play-button",
+                    ".plyr__control",
+                    "div[class*='play']",
+                    "div[role='button']",
+                    "button",
+                    "canvas"
+                ]
+                for sel in selectors:
+                    try:
+                        el = await page.query_selector(sel)
+                        if el:
+                            await el.click(timeout=300)
+                            break
+                    except:
+                        continue
 
-        try:
-            await page.mouse.click(200, 200)
-            print("  👆 First click triggered ad")
-            pages_before = page.context.pages
-            new_tab = None
-            for _ in range(12):
-                pages_now = page.context.pages
-                if len(pages_now) > len(pages_before):
-                    new_tab = [p for p in pages_now if p not in pages_before][0]
-                    break
-                await asyncio.sleep(0.25)
-            if new_tab:
+                # Started after the selector clicks so they can't eat into the click waits
+                deadline = Deadline(STREAM_DEADLINE)
                 try:
-                    await asyncio.sleep(0.5)
-                    url = (new_tab.url or "").lower()
-                    print(f"  🚫 Forcing close on ad tab: {url if url else '(blank/new)'}")
-                    await new_tab.close()
-                except Exception:
-                    print("  ⚠️ Ad tab close failed")
-            await asyncio.sleep(1)
-            await page.mouse.click(200, 200)
-            print("  ▶️ Second click started player")
-        except Exception as e:
-            print(f"⚠️ Momentum click sequence failed: {e}")
+                    await page.mouse.click(200, 200)
+                    print("  👆 First click triggered ad")
+                    await wait_first((stream, popup), deadline.left(AD_TAB_WAIT))
+                    new_tab = popup.value
+                    if new_tab:
+                        try:
+                            url = (new_tab.url or "").lower()
+                            print(f"  🚫 Forcing close on ad tab: {url if url else '(blank/new)'}")
+                            await new_tab.close()
+                        except Exception:
+                            print("  ⚠️ Ad tab close failed")
+                    if not stream.fired and not await stream.wait(deadline.left(REARM_WAIT)):
+                        await page.mouse.click(200, 200)
+                        print("  ▶️ Second click started player")
+                except Exception as e:
+                    print(f"⚠️ Momentum click sequence failed: {e}")
+
+                await stream.wait(deadline.left(STREAM_WAIT))
 
-        for _ in range(4):
+            found = stream.value.url if stream.fired else None
             if found:
-                break
-            await asyncio.sleep(0.25)
+                tier_hits["browser"] += 1
+                print(f"  ⚡ Stream: {found}")
+            else:
+                html = await page.content()
+                matches = M3U8_RE.findall(html)
+                if matches:
+                    found = matches[0]
+                    tier_hits["browser-regex"] += 1
+                    print(f"  🕵️ Fallback: {found}")
 
-        if not found:
-            html = await page.content()
-            matches = re.findall(r'https?://[^\s\"\'<>]+\.m3u8(?:\?[^\"\'<>]*)?', html)
-            if matches:
-                found = matches[0]
-                print(f"  🕵️ Fallback: {found}")
+            return found
+        except Exception as e:
+            total_failures += 1
+            print(f"⚠️ {embed_url} failed: {e}")
+            return None
 
-        return found
-    except Exception as e:
-        total_failures += 1
-        print(f"⚠️ {embed_url} failed: {e}")
+class JsonCache:
+    """Persistent dict of timestamped entries kept in one JSON file.
+
+    ttl(entry) gives an entry's lifetime in seconds; entry() returns a stored
+    entry only while it is younger than that, and expired entries are
+    dropped on save.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.entries = data.get("entries", {}) if data.get("version") == self.VERSION else {}
+
+    def _fresh(self, entry, now):
+        return now - entry["checked"] < self.ttl(entry)
+
+    def entry(self, key):
+        entry = self.entries.get(key)
+        if entry and self._fresh(entry, time.time()):
+            return entry
         return None
 
-def validate_logo(url, category):
+    def put(self, key, **fields):
+        self.entries[key] = dict(fields, checked=time.time())
+
+    def drop(self, key):
+        self.entries.pop(key, None)
+
+    def save(self):
+        now = time.time()
+        entries = {key: e for key, e in self.entries.items() if self._fresh(e, now)}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "entries": entries}, f)
+        os.replace(tmp, self.path)
+
+class LogoCache(JsonCache):
+    """Verdicts of logo HEAD checks keyed by URL; get() is True, False or None"""
+
+    def __init__(self, path):
+        super().__init__(path, lambda entry: LOGO_TTL if entry["ok"] else LOGO_FAIL_TTL)
+
+    def get(self, url):
+        entry = self.entry(url)
+        return entry["ok"] if entry else None
+
+class StreamCache(JsonCache):
+    """Resolved m3u8 URLs keyed by match id and embed URL"""
+
+    def __init__(self, path):
+        super().__init__(path, lambda entry: STREAM_TTL)
+
+def stream_key(match, embed):
+    return f"{match.get('id') or match.get('title')}|{embed}"
+
+async def probe_stream(session, url):
+    """True if url answers like an HLS playlist when fetched with CUSTOM_HEADERS"""
+    return await probe_playlist(session, url, CUSTOM_HEADERS, PROBE_TIMEOUT)
+
+async def reuse_cached_streams(session, cache, matches, embeds):
+    """Return one m3u8 (or None) per match from cached streams that still probe OK.
+
+    Every embed of a match with a fresh cache entry is probed, all matches
+    at once, and the first healthy one in preference order wins. Entries
+    that fail their probe are dropped so the browser resolves them again.
+    """
+    global total_cache_hits, total_cache_misses, total_streams
+    candidates = []
+    for i, (match, source_embeds) in enumerate(zip(matches, embeds)):
+        for embed in (e for urls in source_embeds for e in urls):
+            entry = cache.entry(stream_key(match, embed))
+            if entry:
+                candidates.append((i, stream_key(match, embed), entry["url"]))
+    streams = [None] * len(matches)
+    probes = await asyncio.gather(*(probe_stream(session, url) for _, _, url in candidates))
+    for (i, key, url), ok in zip(candidates, probes):
+        if not ok:
+            cache.drop(key)
+        elif not streams[i]:
+            # The entry keeps the time it was resolved, so STREAM_TTL still expires it
+            streams[i] = url
+    total_cache_hits = sum(1 for url in streams if url)
+    total_cache_misses = len(matches) - total_cache_hits
+    total_streams += total_cache_hits
+    print(f"🗄️ Stream cache: {total_cache_hits} hits, {total_cache_misses} misses "
+          f"({probes.count(False)} failed probes)")
+    return streams
+
+async def fetch_embed_html(session, url, referer=None):
+    headers = dict(CUSTOM_HEADERS)
+    if referer:
+        headers["Referer"] = referer
+    try:
+        async with session.get(url, headers=headers, timeout=EMBED_HTML_TIMEOUT) as res:
+            if res.status != 200:
+                return None
+            return await res.text(errors="ignore")
+    except Exception:
+        return None
+
+def find_m3u8(html):
+    """First stream URL in a page, including JSON-escaped player configs"""
+    text = htmllib.unescape(html.replace("\\/", "/"))
+    for url in M3U8_RE.findall(text):
+        if "prd.jwpltx.com" not in url:
+            return url
+    return None
+
+async def resolve_http(session, embed_url):
+    """Try to resolve an embed without a browser; return (m3u8, tier) or (None, None).
+
+    Looks in the embed HTML first, then in its first few nested iframes.
+    A candidate only counts if it answers a playlist probe, so decoy or
+    stale URLs left in the markup fall through to the browser.
+    """
+    html = await fetch_embed_html(session, embed_url)
+    if html is None:
+        return None, None
+    found = find_m3u8(html)
+    if found and await probe_stream(session, found):
+        return found, "html"
+    for src in IFRAME_RE.findall(html)[:NESTED_IFRAMES]:
+        src = urljoin(embed_url, htmllib.unescape(src))
+        if not src.startswith("http"):
+            continue
+        nested = await fetch_embed_html(session, src, referer=embed_url)
+        found = find_m3u8(nested) if nested else None
+        if found and await probe_stream(session, found):
+            return found, "iframe"
+    return None, None
+
+async def check_logo(session, url):
+    try:
+        async with session.head(url, timeout=LOGO_TIMEOUT, allow_redirects=False) as res:
+            return res.status in (200, 302)
+    except Exception:
+        return False
+
+async def validate_logos(session, cache, urls):
+    """HEAD every URL the cache has no fresh verdict for, all at once"""
+    misses = []
+    for url in dict.fromkeys(urls):
+        if cache.get(url) is None:
+            misses.append(url)
+        else:
+            cache.hits += 1
+    cache.misses += len(misses)
+    for url, ok in zip(misses, await asyncio.gather(*(check_logo(session, u) for u in misses))):
+        cache.put(url, ok=ok)
+
+def fallback_logo(category):
     cat = (category or "other").lower().replace("-", " ").strip()
-    fallback = FALLBACK_LOGOS.get(cat, FALLBACK_LOGOS["other"])
-    if url:
-        try:
-            res = requests.head(url, timeout=2)
-            if res.status_code in (200, 302):
-                return url
-        except Exception:
-            pass
-    return fallback
+    return FALLBACK_LOGOS.get(cat, FALLBACK_LOGOS["other"])
 
 def build_logo_url(match):
+    """Return the (candidate logo URL or None, category) of a match"""
     cat = (match.get("category") or "other").strip()
     teams = match.get("teams") or {}
     for side in ["away", "home"]:
         badge = teams.get(side, {}).get("badge")
         if badge:
-            url = f"https://streamed.pk/api/images/badge/{badge}.webp"
-            return validate_logo(url, cat), cat
+            return f"https://streamed.pk/api/images/badge/{badge}.webp", cat
     if match.get("poster"):
-        url = f"https://streamed.pk/api/images/proxy/{match['poster']}.webp"
-        return validate_logo(url, cat), cat
-    return validate_logo(None, cat), cat
+        return f"https://streamed.pk/api/images/proxy/{match['poster']}.webp", cat
+    return None, cat
+
+async def try_embed(embed, label, pool, session):
+    """Resolve one embed, plain HTTP first, then on a page from the pool"""
+    global total_failures
+    print(f"     • ({label}) {embed}")
+    m3u8, tier = None, None
+    if HTTP_TIER:
+        try:
+            m3u8, tier = await asyncio.wait_for(resolve_http(session, embed), HTTP_TIER_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"     ⏱️ HTTP tier timed out after {HTTP_TIER_TIMEOUT}s: {embed}")
+    if m3u8:
+        tier_hits[tier] += 1
+        print(f"     🌐 Resolved over http ({tier}): {embed}")
+        return m3u8
+    page = await pool.acquire()
+    broken = False
+    try:
+        return await asyncio.wait_for(extract_m3u8(page, embed), EMBED_TIMEOUT)
+    except asyncio.TimeoutError:
+        total_failures += 1
+        broken = True
+        print(f"     ♻️ Page wedged on {embed}, recycling it")
+        return None
+    finally:
+        await pool.release(page, broken)
 
-async def process_match(index, match, total, ctx):
+async def race_embeds(embeds, pool, session, width, want=1):
+    """Try embeds width at a time; return up to want (embed, m3u8) pairs, best first.
+
+    The winners are the best-ranked embeds that resolved. Attempts ranked
+    behind them are cancelled and their pages go back to the pool.
+    """
+    loop = asyncio.get_running_loop()
+    running = {}
+    results = {}
+    next_i = 0
+    grace_end = None
+    try:
+        while True:
+            while grace_end is None and next_i < len(embeds) and len(running) < width:
+                label = f"{next_i + 1}/{len(embeds)}"
+                running[asyncio.ensure_future(try_embed(embeds[next_i], label, pool, session))] = next_i
+                next_i += 1
+            wins = sorted(i for i, url in results.items() if url)[:want]
+            if len(wins) == want:
+                ahead = [i for i in running.values() if i < wins[-1]]
+                if not ahead or (grace_end is not None and loop.time() >= grace_end):
+                    return [(embeds[i], results[i]) for i in wins]
+                if grace_end is None:
+                    grace_end = loop.time() + RACE_GRACE
+            if not running:
+                return [(embeds[i], results[i]) for i in wins]
+            timeout = None if grace_end is None else max(0, grace_end - loop.time())
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results[running.pop(task)] = None if task.exception() else task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+async def process_match(index, match, total, pool, source_embeds, session):
     global total_embeds, total_streams
     title = strip_non_ascii(match.get("title", "Unknown Match"))
     print(f"\n🎯 [{index}/{total}] {title}")
-    sources = match.get("sources", [])
-    match_embeds = 0
-    page = await ctx.new_page()
-    for s in sources:
-        embed_urls = get_embed_urls_from_api(s)
-        total_embeds += len(embed_urls)
-        match_embeds += len(embed_urls)
-        if not embed_urls:
-            continue
-        print(f"  ↳ {len(embed_urls)} embed URLs")
-        for i, embed in enumerate(embed_urls, start=1):
-            print(f"     • ({i}/{len(embed_urls)}) {embed}")
-            m3u8 = await extract_m3u8(page, embed)
-            if m3u8:
-                total_streams += 1
-                print(f"     ✅ Stream OK for {title}")
-                await page.close()
-                return match, m3u8
-    await page.close()
-    print(f"     ❌ No working streams ({match_embeds} embeds)")
-    return match, None
+    embeds = [e for urls in source_embeds for e in urls]
+    total_embeds += len(embeds)
+    if embeds:
+        print(f"  ↳ {len(embeds)} embed URLs")
+    found = await race_embeds(embeds, pool, session, EMBED_RACE, STREAM_CANDIDATES)
+    if found:
+        total_streams += 1
+        print(f"     ✅ Stream OK for {title}" + (f" ({len(found)} candidates)" if len(found) > 1 else ""))
+        return found
+    print(f"     ❌ No working streams ({len(embeds)} embeds)")
+    return []
+
+async def pick_candidates(session, found):
+    """HLS-probe a match's candidate streams and return the (embed, m3u8) to publish"""
+    if len(found) < 2:
+        return found[0]
+    probes = await probe_candidates(session, [url for _, url in found], CUSTOM_HEADERS, PROBE_TIMEOUT)
+    best = pick_stream(probes)
+    if not best:
+        return found[0]
+    print(f"📶 {describe_probe(best)}: {best.url}")
+    return next(pair for pair in found if pair[1] == best.url)
 
 async def generate_playlist():
+    logo_cache = LogoCache(os.path.join(CACHE_DIR, "logos.json"))
+    stream_cache = StreamCache(os.path.join(CACHE_DIR, "streams.json"))
+    async with make_http_session(HTTP_CONNECTIONS, HTTP_PER_HOST) as session:
+        playlist = await build_playlist(session, logo_cache, stream_cache)
+    logo_cache.save()
+    stream_cache.save()
+    print(f"🖼️ Logos: {logo_cache.hits} cached, {logo_cache.misses} checked")
+    return playlist
+
+async def build_playlist(session, logo_cache, stream_cache):
     global total_matches
-    matches = get_all_matches()
+    matches = await get_all_matches(session)
     total_matches = len(matches)
     if not matches:
         print("❌ No matches found.")
         return "#EXTM3U\n"
 
+    # All API lookups finish before the browser starts, so pages never wait on them
+    embeds = await prefetch_embeds(session, matches)
+
+    streams = await reuse_cached_streams(session, stream_cache, matches, embeds)
+    todo = [i for i, url in enumerate(streams) if not url]
+
+    if todo:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True, channel="chrome")
+            ctx = await browser.new_context(extra_http_headers=CUSTOM_HEADERS)
+            blocker = None
+            if LEAN_BROWSING:
+                blocker = ResourceBlocker()
+                await blocker.attach(ctx)
+            pool = PagePool(ctx, MATCH_CONCURRENCY)
+
+            # gather keeps results in match order whatever order they finish in
+            results = await asyncio.gather(
+                *(process_match(i + 1, matches[i], total_matches, pool, embeds[i], session) for i in todo)
+            )
+            await pool.close()
+            await browser.close()
+            if blocker:
+                print(blocker.summary())
+
+        found = [(i, r) for i, r in zip(todo, results) if r]
+        picks = await asyncio.gather(*(pick_candidates(session, r) for _, r in found))
+        for (i, _), (embed, url) in zip(found, picks):
+            streams[i] = url
+            stream_cache.put(stream_key(matches[i], embed), url=url)
+
     content = ["#EXTM3U"]
     success = 0
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True, channel="chrome")
-        ctx = await browser.new_context(extra_http_headers=CUSTOM_HEADERS)
-        sem = asyncio.Semaphore(2)
-
-        async def worker(idx, m):
-            async with sem:
-                return await process_match(idx, m, total_matches, ctx)
-
-        for i, m in enumerate(matches, 1):
-            match, url = await worker(i, m)
-            if not url:
-                continue
-
-            logo, raw_cat = build_logo_url(match)
-            base_cat = (raw_cat or "other").strip().replace("-", " ").lower()
-            display_cat = strip_non_ascii(base_cat.title())
-            tv_id = TV_IDS.get(base_cat, TV_IDS["other"])
-            title = strip_non_ascii(match.get("title", "Untitled"))
-
-            content.append(
-                f'#EXTINF:-1 tvg-id="{tv_id}" tvg-name="{title}" '
-                f'tvg-logo="{logo or FALLBACK_LOGOS["other"]}" group-title="StreamedSU - {display_cat}",{title}'
-            )
-            content.append(f'#EXTVLCOPT:http-origin={CUSTOM_HEADERS["Origin"]}')
-            content.append(f'#EXTVLCOPT:http-referrer={CUSTOM_HEADERS["Referer"]}')
-            content.append(f'#EXTVLCOPT:user-agent={CUSTOM_HEADERS["User-Agent"]}')
-            content.append(url)
-            success += 1
+    found = [(match, url) for match, url in zip(matches, streams) if url]
+    candidates = [build_logo_url(match) for match, _ in found]
+    await validate_logos(session, logo_cache, [logo for logo, _ in candidates if logo])
+    for (match, url), (logo, raw_cat) in zip(found, candidates):
+        if not logo or not logo_cache.get(logo):
+            logo = fallback_logo(raw_cat)
+        base_cat = (raw_cat or "other").strip().replace("-", " ").lower()
+        display_cat = strip_non_ascii(base_cat.title())
+        tv_id = TV_IDS.get(base_cat, TV_IDS["other"])
+        title = strip_non_ascii(match.get("title", "Untitled"))
 
-        await browser.close()
+        content.append(
+            f'#EXTINF:-1 tvg-id="{tv_id}" tvg-name="{title}" '
+            f'tvg-logo="{logo or FALLBACK_LOGOS["other"]}" group-title="StreamedSU - {display_cat}",{title}'
+        )
+        content.append(f'#EXTVLCOPT:http-origin={CUSTOM_HEADERS["Origin"]}')
+        content.append(f'#EXTVLCOPT:http-referrer={CUSTOM_HEADERS["Referer"]}')
+        content.append(f'#EXTVLCOPT:user-agent={CUSTOM_HEADERS["User-Agent"]}')
+        content.append(url)
+        success += 1
 
     print(f"\n🎉 {success} working streams written to playlist.")
     return "\n".join(content)
@@ -266,4 +576,6 @@ if __name__ == "__main__":
     print(f"🔗 Embeds:   {total_embeds}")
     print(f"✅ Streams:  {total_streams}")
     print(f"❌ Failures: {total_failures}")
+    print(f"🗄️ Cache:    {total_cache_hits} hits / {total_cache_misses} misses")
+    print("🧭 Tiers:    " + ", ".join(f"{tier} {n}" for tier, n in tier_hits.items()))
     print("------------------------------------------------")